@@ -2,7 +2,6 @@ import time, os, gc, psutil, subprocess, numpy as np, pandas as pd
 import geopandas as gpd
 import rasterio
 from osgeo import gdal
-from sqlalchemy import create_engine
 
 
 class GISBenchmarkEngine:
@@ -52,6 +51,19 @@ class GISBenchmarkEngine:
                 dx, dy = np.gradient(arr)
                 _ = np.sqrt(dx**2 + dy**2)
         results.append(self._profile_task("Rasterio/NumPy", rio_np))
+        # Rasterio/NumPy strumieniowo: okna bloków z 1-pikselowym halo
+        def rio_np_windowed():
+            from rasterio.windows import Window
+            with rasterio.open(path) as src:
+                for _, win in src.block_windows(1):
+                    col, row = max(0, win.col_off - 1), max(0, win.row_off - 1)
+                    w = min(src.width, win.col_off + win.width + 1) - col
+                    h = min(src.height, win.row_off + win.height + 1) - row
+                    arr = src.read(1, window=Window(col, row, w, h))
+                    if min(arr.shape) < 2: continue
+                    dx, dy = np.gradient(arr)
+                    _ = np.sqrt(dx**2 + dy**2)
+        results.append(self._profile_task("Rasterio/NumPy (okna)", rio_np_windowed))
         return pd.DataFrame(results)
 
     # --- 3. LiDAR:  ---
@@ -73,8 +85,9 @@ class GISBenchmarkEngine:
     # --- 4. PostGIS:  ---
     def run_db_deployment(self, path):
         if not self.db_conn: return pd.DataFrame()
+        from core.db_iface import PostGISConnector, get_engine, pool_stats
         results = []
-        engine = create_engine(self.db_conn)
+        engine = get_engine(self.db_conn)
         # SQLAlchemy/GeoPandas
         def gpd_sql():
             gdf = gpd.read_file(path)
@@ -84,4 +97,47 @@ class GISBenchmarkEngine:
         uri = self.db_conn.replace("postgresql://", "PG:").replace("@", " ").replace("/", " dbname=")
         cmd = ["ogr2ogr", "-f", "PostgreSQL", uri, path, "-nln", "bench_ogr", "-overwrite"]
         results.append(self._profile_task("OGR (ogr2ogr)", lambda: subprocess.run(cmd, capture_output=True, shell=True)))
-        return pd.DataFrame(results)
\ No newline at end of file
+        # COPY FROM STDIN (psycopg2, strumieniowo) - ta sama pula co GPD
+        connector = PostGISConnector(self.db_conn)
+        connector.connect()
+        results.append(self._profile_task("COPY (psycopg2)", lambda: connector.import_with_copy(path, table_name="bench_copy")))
+        print(f"[DB] Pula połączeń: {pool_stats(engine)}")
+        return pd.DataFrame(results)
+
+    # --- 5. Backendy operacji Analiz: lokalnie vs PostGIS ---
+    def run_backend_comparison(self, path, distance=10.0):
+        if not self.db_conn: return pd.DataFrame()
+        import tempfile
+        import shapely
+        from core.data_io import load_vector, save_vector
+        from core.db_iface import PostGISConnector
+        from core.db_processing import LocalBackend, PostGISBackend
+
+        connector = PostGISConnector(self.db_conn)
+        connector.connect()
+        # Import nie jest mierzony - porównujemy same operacje
+        connector.import_with_copy(path, table_name="bench_src")
+
+        tmp = tempfile.mkdtemp(prefix="bench_backend_")
+        # Maska: środkowa ćwiartka zasięgu warstwy
+        src = load_vector(path, columns=[])
+        x0, y0, x1, y1 = src.total_bounds
+        dx, dy = (x1 - x0) / 4, (y1 - y0) / 4
+        mask_path = os.path.join(tmp, "mask.gpkg")
+        save_vector(gpd.GeoDataFrame(geometry=[shapely.box(x0 + dx, y0 + dy, x1 - dx, y1 - dy)], crs=src.crs), mask_path)
+        polygons = src.geom_type.isin(["Polygon", "MultiPolygon"]).any()
+
+        local, db = LocalBackend(), PostGISBackend(connector)
+        results = []
+        for op in ["buffer", "centroids", "clip"] + (["polygon_to_line"] if polygons else []):
+            out = os.path.join(tmp, f"{op}.gpkg")
+            args = (distance,) if op == "buffer" else ()
+            if op == "clip":
+                jobs = [(local, lambda: local.clip(path, mask_path, out)),
+                        (db, lambda: db.clip("bench_src", mask_path, "bench_clip"))]
+            else:
+                jobs = [(local, lambda: getattr(local, op)(path, out, *args)),
+                        (db, lambda: getattr(db, op)("bench_src", f"bench_{op}", *args))]
+            for backend, job in jobs:
+                results.append(self._profile_task(f"{op} / {backend.name}", job))
+        return pd.DataFrame(results)
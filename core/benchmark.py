@@ -1,8 +1,10 @@
 import time
 import os
+import shutil
+import tempfile
 from qgis.core import QgsVectorLayer
 from sqlalchemy import text
-from core.processing import vector_buffer
+from core.processing import vector_buffer, vector_buffer_bulk
 
 # Próba importu GeoPandas (może go nie być)
 try:
@@ -59,6 +61,21 @@ class Benchmarker:
         else:
             results['GeoPandas (Python)'] = "Brak biblioteki"
 
+        # --- TEST 2b: Shapely 2 (wektorowo, zapis jednym wywołaniem) ---
+        # Wynik w katalogu tymczasowym - shapefile to kilka plików (.shp, .shx, .dbf, .prj)
+        temp_dir = tempfile.mkdtemp(prefix="bench_bulk_")
+        temp_out_bulk = os.path.join(temp_dir, f"{layer_name}.shp")
+        try:
+            start = time.perf_counter()
+            for _ in range(runs):
+                vector_buffer_bulk(shapefile_path, temp_out_bulk, distance)
+            end = time.perf_counter()
+            results['Shapely 2 (wektorowo)'] = (end - start) / runs
+        except Exception as e:
+            results['Shapely 2 (wektorowo)'] = f"Błąd: {e}"
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
         # --- TEST 3: PostGIS (Server-side SQL) ---
         if self.db and self.db.engine:
             try:
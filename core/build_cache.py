@@ -0,0 +1,110 @@
+# core/build_cache.py
+"""
+Cache budowania map webowych (web_cache/build_manifest.json).
+Klucz artefaktu = skrót z: wersji generatora, skrótu zawartości danych źródłowych,
+CRS/stylu i pozostałych parametrów. Każdy artefakt zajmuje "slot" (katalog/plik
+w web_cache) - zmiana klucza oznacza przebudowę slotu w miejscu. Niezmienione warstwy korzystają z gotowych
+artefaktów (przygotowany GeoJSON, PNG, kafle), przetwarzane są tylko zmienione.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+# Zmiana wersji unieważnia wszystkie artefakty (np. po zmianie sposobu generowania)
+GENERATOR_VERSION = "2026.10-2"
+
+# Pliki towarzyszące - ich zmiana też zmienia dane warstwy
+_SIDECARS = {".shp": (".dbf", ".shx", ".prj", ".cpg"), ".tif": (".tfw", ".aux.xml"), ".tiff": (".tfw", ".aux.xml")}
+
+
+class BuildCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, "build_manifest.json")
+        self._lock = threading.Lock()
+        self.manifest = {"version": GENERATOR_VERSION, "digests": {}, "artifacts": {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == GENERATOR_VERSION:
+                    self.manifest = data
+            except Exception:
+                pass
+
+    @staticmethod
+    def _hash_file(path, hsh):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hsh.update(chunk)
+
+    def digest(self, path):
+        """
+        Skrót zawartości pliku (z plikami towarzyszącymi). Zapamiętywany razem
+        z rozmiarem i mtime - plik jest czytany ponownie tylko, gdy te się zmienią.
+        """
+        path = os.path.abspath(path)
+        base, ext = os.path.splitext(path)
+        files = [path] + [base + s for s in _SIDECARS.get(ext.lower(), ()) if os.path.exists(base + s)]
+        stamp = [[os.path.getsize(p), os.stat(p).st_mtime_ns] for p in files]
+
+        with self._lock:
+            memo = self.manifest["digests"].get(path)
+        if memo and memo[0] == stamp:
+            return memo[1]
+
+        hsh = hashlib.blake2b(digest_size=16)
+        for p in files:
+            self._hash_file(p, hsh)
+        value = hsh.hexdigest()
+        with self._lock:
+            self.manifest["digests"][path] = [stamp, value]
+        return value
+
+    @staticmethod
+    def key(*parts):
+        """Klucz artefaktu z dowolnych parametrów serializowalnych do JSON."""
+        raw = json.dumps([GENERATOR_VERSION, *parts], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, slot, key):
+        """
+        Artefakt (słownik) zapisany w slocie (np. "tiles/<warstwa>"), jeśli powstał
+        dla tego samego klucza i wszystkie jego pliki istnieją; inaczej None.
+        """
+        with self._lock:
+            art = self.manifest["artifacts"].get(slot)
+        if art is None or art.get("key") != key: return None
+        if any(not os.path.exists(os.path.join(self.cache_dir, f)) for f in art.get("files", [])):
+            return None
+        return art
+
+    def put(self, slot, key, files=(), **meta):
+        """Zapisuje artefakt slotu: files - ścieżki względem cache_dir, meta - dowolne dane (JSON)."""
+        with self._lock:
+            self.manifest["artifacts"][slot] = dict(meta, key=key, files=list(files))
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f)
+            os.replace(tmp, self.path)
+
+    def replace_if_changed(self, tmp_path, dst_path):
+        """
+        Podmienia dst_path plikiem tmp_path tylko, gdy treść się różni (np. ponowny
+        eksport warstwy zdalnej). Przy braku zmian dst_path zachowuje mtime,
+        więc zależne cache pozostają ważne. Zwraca True, gdy plik się zmienił.
+        """
+        if os.path.exists(dst_path):
+            a, b = hashlib.blake2b(digest_size=16), hashlib.blake2b(digest_size=16)
+            self._hash_file(tmp_path, a)
+            self._hash_file(dst_path, b)
+            if a.digest() == b.digest():
+                os.remove(tmp_path)
+                return False
+        shutil.move(tmp_path, dst_path)
+        return True
@@ -0,0 +1,60 @@
+# core/colormap.py
+"""
+Rampy kolorów dla rastrów wysokościowych (wspólne dla mapy 2D, 3D i podglądu Open3D).
+Kolorowanie jest wektorowe: tablica LUT (np.interp na kanał) indeksowana
+znormalizowanymi wartościami - bez pętli po pikselach w Pythonie.
+"""
+import numpy as np
+
+# Rampa hipsometryczna: ciemna zieleń -> jasna zieleń -> krem -> brąz -> ciemny brąz
+HYPSO_RAMP = ("#267300", "#8BD100", "#FFFFBE", "#C88200", "#642800")
+
+
+def hex_to_rgb(colors):
+    """("#RRGGBB", ...) -> tablica (n, 3) float w zakresie 0-255."""
+    return np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors], dtype=float)
+
+
+def ramp_table(colors=HYPSO_RAMP):
+    """Stopy (równomiernie 0-1) i kolory RGB 0-255 rampy."""
+    return np.linspace(0.0, 1.0, len(colors)), hex_to_rgb(colors)
+
+
+def ramp_lut(colors=HYPSO_RAMP, size=256):
+    """Tablica LUT (size, 3) uint8 - interpolacja liniowa między stopami, osobno dla kanałów."""
+    stops, rgb = ramp_table(colors)
+    x = np.linspace(0.0, 1.0, size)
+    return np.stack([np.interp(x, stops, rgb[:, k]) for k in range(3)], axis=1).astype(np.uint8)
+
+
+def normalize(values, vmin=None, vmax=None, mask=None):
+    """Skalowanie do 0-1 (zakres z danych w masce, gdy nie podano vmin/vmax)."""
+    values = np.asarray(values, dtype=float)
+    valid = values[mask] if mask is not None else values[np.isfinite(values)]
+    if vmin is None: vmin = valid.min() if valid.size else 0.0
+    if vmax is None: vmax = valid.max() if valid.size else 1.0
+    span = max(float(vmax - vmin), 1e-12)
+    return np.clip((values - vmin) / span, 0.0, 1.0)
+
+
+def apply_ramp(norm, colors=HYPSO_RAMP, lut=None):
+    """
+    Wartości 0-1 (dowolny kształt) -> RGB uint8 o kształcie norm.shape + (3,).
+    NaN dostaje kolor pierwszego stopnia rampy - do ukrycia braków danych
+    służy ramp_rgba (alfa 0) albo własna maska.
+    """
+    if lut is None: lut = ramp_lut(colors)
+    norm = np.nan_to_num(np.asarray(norm, dtype=float), nan=0.0)
+    idx = np.clip(np.rint(norm * (len(lut) - 1)), 0, len(lut) - 1).astype(np.intp)
+    return lut[idx]
+
+
+def ramp_rgba(norm, mask=None, colors=HYPSO_RAMP):
+    """Jak apply_ramp, z kanałem alfa: 255 w masce, 0 poza nią i dla NaN."""
+    norm = np.asarray(norm, dtype=float)
+    visible = np.isfinite(norm)
+    if mask is not None: visible &= np.asarray(mask, dtype=bool)
+    out = np.empty(norm.shape + (4,), dtype=np.uint8)
+    out[..., :3] = apply_ramp(norm, colors)
+    out[..., 3] = visible.astype(np.uint8) * 255
+    return out
@@ -1,17 +1,83 @@
 # core/data_io.py
 import geopandas as gpd
-import rasterio
 import pandas as pd
+import pyogrio
 from shapely.geometry import Point
 from pathlib import Path
 
-def load_vector(path, sql=None):
+try:
+    import rasterio
+except ImportError:
+    rasterio = None
+
+# Odczyt przez Arrow wymaga pyarrow - bez niego pyogrio czyta klasycznie
+try:
+    import pyarrow
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+def load_vector(path, sql=None, columns=None, bbox=None, mask=None, where=None, layer=None,
+                read_geometry=True, skip_features=0, max_features=None):
+    """
+    Load vector layers into GeoDataFrame using pyogrio (Arrow when available).
+    Filters are pushed down to the OGR driver, so only the requested
+    rows and columns are ever materialized:
+      columns - list of attribute columns to read ([] = geometry only)
+      bbox    - (minx, miny, maxx, maxy) in the layer CRS
+      mask    - shapely geometry used as a spatial filter (layer CRS)
+      where   - attribute filter (OGR SQL WHERE clause)
+      sql     - full SQL statement, executed by the driver (GPKG/PostGIS dialect)
+    """
+    path = str(path)
+    kwargs = dict(
+        layer=layer, columns=columns, bbox=bbox, mask=mask, where=where, sql=sql,
+        read_geometry=read_geometry, skip_features=skip_features, max_features=max_features
+    )
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    return pyogrio.read_dataframe(path, use_arrow=HAS_ARROW, **kwargs)
+
+def iter_vector_batches(path, batch_size=100_000, layer=None, columns=None, bbox=None):
+    """
+    Yield the layer as consecutive GeoDataFrames of at most batch_size rows from one
+    sequential read (pyogrio Arrow stream), instead of re-reading with skip_features.
+    bbox is pushed down to the driver as in load_vector.
+    Without pyarrow the layer is read once and sliced.
     """
-    Load vector layers into GeoDataFrame using geopandas.
-    Optionally provide SQL for driver supporting it.
+    path = str(path)
+    if not HAS_ARROW:
+        gdf = load_vector(path, layer=layer, columns=columns, bbox=bbox)
+        for start in range(0, len(gdf), batch_size):
+            yield gdf.iloc[start:start + batch_size]
+        return
+
+    from pyogrio.raw import open_arrow
+    try:
+        stream = open_arrow(path, layer=layer, columns=columns, bbox=bbox, batch_size=batch_size, use_pyarrow=True)
+    except TypeError:  # pyogrio < 0.8 returns a pyarrow RecordBatchReader directly
+        stream = open_arrow(path, layer=layer, columns=columns, bbox=bbox, batch_size=batch_size)
+    with stream as (meta, reader):
+        geom_col = meta.get("geometry_name") or "wkb_geometry"
+        crs = meta.get("crs")
+        for batch in reader:
+            df = batch.to_pandas()
+            geoms = gpd.GeoSeries.from_wkb(df.pop(geom_col), crs=crs) if geom_col in df.columns else None
+            yield gpd.GeoDataFrame(df, geometry=geoms, crs=crs)
+
+def save_vector(gdf, path, layer=None, append=False, **kwargs):
+    """
+    Save GeoDataFrame with a single bulk write (pyogrio).
     """
     path = str(path)
-    return gpd.read_file(path)
+    if layer is not None: kwargs["layer"] = layer
+    pyogrio.write_dataframe(gdf, path, append=append, **kwargs)
+    return path
+
+def vector_info(path, layer=None):
+    """
+    Layer metadata without reading features: crs, fields, dtypes, features, total_bounds.
+    """
+    return pyogrio.read_info(str(path), layer=layer)
 
 def load_raster(path):
     """
@@ -0,0 +1,170 @@
+# core/db_processing.py
+"""
+Backendy operacji z zakładki Analizy:
+  LocalBackend   - GeoPandas/OGR na plikach (core.processing),
+  PostGISBackend - CREATE TABLE AS SELECT w bazie; dane nie opuszczają serwera,
+                   do GUI wraca tylko nazwa tabeli wynikowej.
+Oba backendy mają te same metody: buffer, centroids, clip, polygon_to_line, extract.
+"""
+import os
+from sqlalchemy import text
+
+from core.processing import (
+    vector_buffer_bulk, centroids_geopandas, clip_vector_geopandas,
+    polygon_to_line, extract_by_attribute, build_attribute_filter
+)
+from core.db_iface import _quote_ident
+
+# Typy information_schema traktowane jak liczbowe (dla build_attribute_filter)
+_NUMERIC_TYPES = ("smallint", "integer", "bigint", "numeric", "real", "double precision")
+
+
+class LocalBackend:
+    """Przetwarzanie po stronie klienta: src/out to ścieżki plików."""
+    name = "Lokalnie (GeoPandas/OGR)"
+
+    def buffer(self, src, out, distance, workers=None):
+        vector_buffer_bulk(src, out, distance, workers=workers)
+        return out
+
+    def centroids(self, src, out):
+        centroids_geopandas(src, out)
+        return out
+
+    def clip(self, src, mask, out):
+        clip_vector_geopandas(src, mask, out)
+        return out
+
+    def polygon_to_line(self, src, out):
+        polygon_to_line(src, out)
+        return out
+
+    def extract(self, src, out, column=None, value=None, conditions=None, combine="AND"):
+        extract_by_attribute(src, out, column=column, value=value, conditions=conditions, combine=combine)
+        return out
+
+
+class PostGISBackend:
+    """
+    Przetwarzanie w bazie: src/out to nazwy tabel ("schemat.tabela" lub "tabela").
+    Wynik: tabela z atrybutami źródła i kolumną geom (SRID źródła), indeks GIST, ANALYZE.
+    """
+    name = "PostGIS (SQL)"
+
+    def __init__(self, connector, schema="public"):
+        self.db = connector
+        self.schema = schema
+        if self.db.engine is None: self.db.connect()
+
+    def _split(self, table):
+        schema, _, name = str(table).rpartition(".")
+        return (schema or self.schema).strip('"'), name.strip('"')
+
+    def _layer(self, conn, table):
+        """Kolumna geometrii, SRID i atrybuty (nazwa -> typ) tabeli źródłowej."""
+        schema, name = self._split(table)
+        row = conn.execute(
+            text("SELECT f_geometry_column, srid FROM geometry_columns "
+                 "WHERE f_table_schema = :s AND f_table_name = :t LIMIT 1"),
+            {"s": schema, "t": name}
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Tabela {schema}.{name} nie ma kolumny geometrii.")
+        cols = conn.execute(
+            text("SELECT column_name, data_type FROM information_schema.columns "
+                 "WHERE table_schema = :s AND table_name = :t ORDER BY ordinal_position"),
+            {"s": schema, "t": name}
+        ).fetchall()
+        attrs = {c: t for c, t in cols if c != row[0]}
+        return {"ident": f"{_quote_ident(schema)}.{_quote_ident(name)}", "geom": f"t.{_quote_ident(row[0])}",
+                "srid": row[1] or 0, "attrs": attrs}
+
+    def _run(self, label, src, out, build, params=None):
+        """build(layer) -> SELECT z kolumną geom; wynik zapisywany jako nowa tabela out."""
+        schema, name = self._split(out)
+        target = f"{_quote_ident(schema)}.{_quote_ident(name)}"
+        with self.db.engine.begin() as conn:
+            layer = self._layer(conn, src)
+            select = build(layer)
+            attrs = "".join(f"t.{_quote_ident(c)}, " for c in layer["attrs"])
+            sql = f"SELECT {attrs}({select['geom']})::geometry(Geometry, {layer['srid']}) AS geom " \
+                  f"FROM {layer['ident']} t {select.get('from', '')} {select.get('where', '')}"
+
+            conn.execute(text(f"DROP TABLE IF EXISTS {target}"))
+            conn.execute(text(f"CREATE TABLE {target} AS {sql}"), params or {})
+            if select.get("drop_empty"):
+                conn.execute(text(f"DELETE FROM {target} WHERE geom IS NULL OR ST_IsEmpty(geom)"))
+            conn.execute(text(f"CREATE INDEX ON {target} USING GIST (geom)"))
+            conn.execute(text(f"ANALYZE {target}"))
+            rows = conn.execute(text(f"SELECT count(*) FROM {target}")).scalar()
+
+        self.db.invalidate_catalog()
+        print(f"[PostGIS] {label}: {rows} obiektów -> {schema}.{name}")
+        return f"{schema}.{name}"
+
+    def buffer(self, src, out, distance, workers=None):
+        return self._run("Bufor", src, out,
+                         lambda l: {"geom": f"ST_Buffer({l['geom']}, :d)"}, {"d": float(distance)})
+
+    def centroids(self, src, out):
+        return self._run("Centroidy", src, out, lambda l: {"geom": f"ST_Centroid({l['geom']})"})
+
+    def polygon_to_line(self, src, out):
+        return self._run("Poligon -> Linia", src, out, lambda l: {"geom": f"ST_Boundary({l['geom']})"})
+
+    def clip(self, src, mask, out):
+        """
+        mask: ścieżka pliku (geometria wysyłana do bazy jako WKB) albo tabela w tej samej bazie.
+        Obiekty w całości wewnątrz maski nie są przycinane; z wyniku przycięcia
+        zostają tylko części o wymiarze źródła (jak gpd.clip(keep_geom_type=True)).
+        """
+        params = {}
+        if os.path.exists(str(mask)):
+            import shapely
+            from pyproj import CRS
+            from core.data_io import load_vector
+
+            mask_gdf = load_vector(mask, columns=[])
+            if mask_gdf.empty: raise ValueError("Maska jest pusta.")
+            params["mask"] = shapely.to_wkb(shapely.union_all(mask_gdf.geometry.values))
+            mask_srid = (CRS.from_user_input(mask_gdf.crs).to_epsg() if mask_gdf.crs else None)
+
+            def mask_expr(l):
+                if mask_srid and mask_srid != l["srid"]:
+                    return f"ST_Transform(ST_SetSRID(ST_GeomFromWKB(:mask), {mask_srid}), {l['srid']})"
+                return f"ST_SetSRID(ST_GeomFromWKB(:mask), {l['srid']})"
+        else:
+            with self.db.engine.connect() as conn:
+                mask_layer = self._layer(conn, mask)
+
+            def mask_expr(l):
+                return (f"(SELECT ST_Union(ST_Transform({mask_layer['geom']}, {l['srid']})) "
+                        f"FROM {mask_layer['ident']} t)")
+
+        def build(l):
+            g = l["geom"]
+            return {
+                "geom": f"CASE WHEN ST_CoveredBy({g}, m.g) THEN {g} "
+                        f"ELSE ST_CollectionExtract(ST_Intersection({g}, m.g), ST_Dimension({g}) + 1) END",
+                "from": f"CROSS JOIN (SELECT {mask_expr(l)} AS g) m",
+                "where": f"WHERE {g} && m.g AND ST_Intersects({g}, m.g)",
+                "drop_empty": True,
+            }
+
+        return self._run("Przycinanie", src, out, build, params)
+
+    def extract(self, src, out, column=None, value=None, conditions=None, combine="AND"):
+        conditions = list(conditions or [])
+        if column is not None:
+            conditions.insert(0, (column, value))
+        if not conditions:
+            raise ValueError("Nie podano warunku ekstrakcji.")
+
+        def build(l):
+            dtypes = {c: ("float64" if t in _NUMERIC_TYPES else "object") for c, t in l["attrs"].items()}
+            where = build_attribute_filter(conditions, dtypes, combine)
+            print(f"[PostGIS] Wyodrębnianie: WHERE {where}")
+            # Literały trafiają do text() - ':' w wartości (np. '12:30') byłby parametrem
+            return {"geom": l["geom"], "where": "WHERE " + where.replace(":", "\\:")}
+
+        return self._run("Wyodrębnianie", src, out, build)
@@ -0,0 +1,132 @@
+# core/generalize.py
+"""
+Generalizacja geometrii przed eksportem do przeglądarki (EPSG:4326):
+  - upraszczanie z zachowaniem topologii, z tolerancją dobraną do przedziału zoomu,
+  - kwantyzacja współrzędnych (np.round) do liczby miejsc po przecinku
+    odpowiadającej rozmiarowi piksela na docelowym zoomie.
+Wynik zapisywany jest w web_cache/gen (GeoJSON z COORDINATE_PRECISION) razem
+ze statystykami, osobno dla każdego pliku źródłowego i tolerancji.
+"""
+import os
+import json
+import math
+import hashlib
+import numpy as np
+import shapely
+import geopandas as gpd
+
+from core.data_io import load_vector, save_vector
+
+# Przedziały zoomu: geometria upraszczana dla największego zoomu w przedziale,
+# więc wygląda poprawnie w całym przedziale
+ZOOM_BANDS = ((0, 6), (7, 10), (11, 14), (15, 18), (19, 22))
+
+# Punkt odniesienia raportu: GeoJSON z 7 miejscami po przecinku (~1 cm, zalecenie
+# RFC 7946). Porównanie z pełnymi 15-17 cyframi float64 zawyżałoby zysk - samo
+# obcięcie zbędnych cyfr nie wymaga generalizacji.
+BASELINE_DIGITS = 7
+
+
+def zoom_band(zoom):
+    zoom = int(round(zoom))
+    for lo, hi in ZOOM_BANDS:
+        if lo <= zoom <= hi:
+            return lo, hi
+    return ZOOM_BANDS[-1]
+
+
+def degrees_per_pixel(zoom):
+    """Rozmiar piksela (256 px kafel) w stopniach długości geograficznej."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def tolerance_for_zoom(zoom, pixels=0.5):
+    """Tolerancja upraszczania [stopnie] - pół piksela na górnej granicy przedziału zoomu."""
+    return pixels * degrees_per_pixel(zoom_band(zoom)[1])
+
+
+def precision_for_zoom(zoom, pixels=0.1):
+    """Liczba miejsc po przecinku, przy której błąd zaokrąglenia < pixels piksela."""
+    return max(0, math.ceil(-math.log10(pixels * degrees_per_pixel(zoom_band(zoom)[1]))))
+
+
+def generalize_geometries(geoms, zoom):
+    """Upraszcza (preserve_topology) i kwantyzuje tablicę geometrii w EPSG:4326."""
+    digits = precision_for_zoom(zoom)
+    simplified = shapely.simplify(geoms, tolerance_for_zoom(zoom), preserve_topology=True)
+    return shapely.transform(simplified, lambda c: np.round(c, digits))
+
+
+def _geojson_bytes(geoms, digits=None):
+    """
+    Rozmiar geometrii zapisanych jako GeoJSON z podaną liczbą miejsc po przecinku
+    (puste pomijane - GEOS ich nie zapisze).
+    """
+    geoms = geoms[~(shapely.is_empty(geoms) | shapely.is_missing(geoms))]
+    if digits is not None:
+        geoms = shapely.transform(geoms, lambda c: np.round(c, digits))
+    return int(sum(len(g) for g in shapely.to_geojson(geoms)))
+
+
+def generalize_vector(src_path, zoom, cache_dir=None, columns=None, geometry_column=None):
+    """
+    Wczytuje warstwę, przelicza do EPSG:4326 i generalizuje dla podanego zoomu.
+    Zwraca (GeoDataFrame, stats). stats: zoom_band, tolerance, digits,
+    vertices_before/after, bytes_before/after (GeoJSON geometrii; "before" przy
+    BASELINE_DIGITS miejscach po przecinku, nie w pełnej precyzji), cached.
+    """
+    tol, digits = tolerance_for_zoom(zoom), precision_for_zoom(zoom)
+    cache_path = None
+    if cache_dir:
+        key = hashlib.sha1(
+            json.dumps([os.path.abspath(src_path), tol, digits, sorted(columns) if columns is not None else None,
+                        BASELINE_DIGITS])
+            .encode("utf-8")
+        ).hexdigest()[:12]
+        base = os.path.splitext(os.path.basename(src_path))[0]
+        gen_dir = os.path.join(cache_dir, "gen")
+        os.makedirs(gen_dir, exist_ok=True)
+        cache_path = os.path.join(gen_dir, f"{base}_{key}.geojson")
+        stats_path = cache_path + ".json"
+        if os.path.exists(stats_path) and os.path.getmtime(src_path) <= os.path.getmtime(cache_path):
+            with open(stats_path, encoding="utf-8") as f:
+                stats = dict(json.load(f), cached=True)
+            return load_vector(cache_path), stats
+
+    gdf = load_vector(src_path, columns=columns)
+    if geometry_column and geometry_column in gdf.columns:
+        gdf = gdf.set_geometry(geometry_column)
+    gdf = gdf[gdf.geometry.notnull()]
+    if gdf.crs is not None and gdf.crs != "EPSG:4326":
+        gdf = gdf.to_crs("EPSG:4326")
+
+    before = np.asarray(gdf.geometry.array)
+    after = generalize_geometries(before, zoom)
+    gdf = gdf.set_geometry(gpd.GeoSeries(after, index=gdf.index, crs="EPSG:4326"))
+    gdf = gdf[~gdf.geometry.is_empty]
+
+    stats = {
+        "source": os.path.basename(src_path), "zoom_band": list(zoom_band(zoom)),
+        "tolerance": tol, "digits": digits,
+        "vertices_before": int(shapely.get_num_coordinates(before).sum()),
+        "vertices_after": int(shapely.get_num_coordinates(after).sum()),
+        "bytes_before": _geojson_bytes(before, BASELINE_DIGITS),
+        "bytes_after": _geojson_bytes(after),
+        "baseline_digits": BASELINE_DIGITS,
+        "cached": False,
+    }
+    if cache_path:
+        if os.path.exists(cache_path): os.remove(cache_path)
+        save_vector(gdf, cache_path, driver="GeoJSON", layer_options={"COORDINATE_PRECISION": digits})
+        with open(cache_path + ".json", "w", encoding="utf-8") as f:
+            json.dump(stats, f)
+    return gdf, stats
+
+
+def format_reduction(stats):
+    """Jedna linia do GUI: 'nazwa: 12.3 MB -> 1.9 MB (-40% wzgl. GeoJSON 7 miejsc), wierzchołki 1 200 000 -> 180 000'."""
+    b0, b1 = stats["bytes_before"], stats["bytes_after"]
+    pct = 100.0 * (1 - b1 / b0) if b0 else 0.0
+    return (f"{stats['source']}: {b0 / 1e6:.1f} MB -> {b1 / 1e6:.1f} MB (-{pct:.0f}% "
+            f"wzgl. GeoJSON {stats.get('baseline_digits', BASELINE_DIGITS)} miejsc), "
+            f"wierzchołki {stats['vertices_before']:,} -> {stats['vertices_after']:,}")
@@ -0,0 +1,25 @@
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def default_workers():
+    """Liczba procesów roboczych: wszystkie rdzenie poza jednym (min. 1)."""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def process_pool(workers=None):
+    """
+    Tworzy ProcessPoolExecutor w trybie 'spawn' (jedyny dostępny na Windows).
+    Gdy aplikacja działa wewnątrz QGIS, sys.executable może wskazywać na
+    qgis-bin.exe - wtedy podstawiamy interpreter Pythona z tego samego środowiska.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    exe = os.path.basename(sys.executable).lower()
+    if not exe.startswith("python"):
+        name = "python.exe" if os.name == "nt" else os.path.join("bin", "python3")
+        candidate = os.path.join(sys.exec_prefix, name)
+        if os.path.exists(candidate):
+            ctx.set_executable(candidate)
+    return ProcessPoolExecutor(max_workers=workers or default_workers(), mp_context=ctx)
@@ -0,0 +1,194 @@
+# core/pointcloud_tiles.py
+"""
+Chmura punktów LAS/LAZ jako hierarchia LOD (octree) w formacie 3D Tiles 1.0:
+tileset.json + pliki pnts. Każdy węzeł zawiera próbkę przestrzenną (jeden punkt
+na komórkę siatki voxel o boku rozmiar_węzła / cells), pozostałe punkty schodzą
+do dzieci (refine ADD). Przeglądarka (deck.gl Tile3DLayer) pobiera tylko węzły
+w widoku, z gęstością zależną od odległości - pełna chmura bez losowego próbkowania.
+Drzewo budowane raz na plik źródłowy (cache w web_cache/pointcloud).
+"""
+import os
+import json
+import shutil
+import struct
+import numpy as np
+
+from core.colormap import HYPSO_RAMP, apply_ramp, normalize
+
+try:
+    import laspy
+except ImportError:
+    laspy = None
+
+try:
+    from pyproj import CRS, Transformer
+except ImportError:
+    CRS = Transformer = None
+
+
+def _metric_frame(header):
+    """
+    CRS chmury i transformacja do układu metrycznego, w którym budowany jest octree.
+    Układy geograficzne (i projekcje w stopach itp.) przeliczane są do lokalnego
+    azymutalnego równoodległego (AEQD) w środku zasięgu; metryczne - bez zmian.
+    Zwraca (crs_metryczny, transformer_lub_None).
+    """
+    try:
+        crs = header.parse_crs()
+    except Exception:
+        crs = None
+    if crs is None:
+        # Jak w add_lidar_layer_3d: współrzędne > 180 traktujemy jako PL-1992
+        crs = "EPSG:2180" if header.mins[0] > 180 else "EPSG:4326"
+    crs = CRS.from_user_input(crs)
+    if crs.is_projected and crs.axis_info and crs.axis_info[0].unit_name in ("metre", "meter"):
+        return crs, None
+
+    cx = (header.mins[0] + header.maxs[0]) / 2
+    cy = (header.mins[1] + header.maxs[1]) / 2
+    lon, lat = Transformer.from_crs(crs, "EPSG:4326", always_xy=True).transform(cx, cy)
+    local = CRS.from_proj4(f"+proj=aeqd +lat_0={lat} +lon_0={lon} +datum=WGS84 +units=m +no_defs")
+    return local, Transformer.from_crs(crs, local, always_xy=True)
+
+
+def _read_points(las_path, chunk_size, base_elevation, z_exaggeration):
+    """
+    Cała chmura porcjami (chunk_iterator) w układzie metrycznym (_metric_frame):
+    współrzędne lokalne float32 względem origin (oszczędność pamięci), kolory RGB
+    uint8 (None, gdy plik ich nie ma), CRS metryczny.
+    Wysokość: (z - base_elevation) * z_exaggeration, jak w pozostałych warstwach 3D.
+    """
+    with laspy.open(las_path) as reader:
+        header = reader.header
+        crs, to_metric = _metric_frame(header)
+        n = int(header.point_count)
+        if to_metric is None:
+            origin = np.array(header.mins, dtype=np.float64)
+        else:
+            origin = np.zeros(3)  # AEQD ma środek w środku zasięgu chmury
+            origin[2] = header.mins[2]
+        origin[2] = (origin[2] - base_elevation) * z_exaggeration
+        has_rgb = "red" in set(header.point_format.dimension_names)
+        xyz = np.empty((n, 3), dtype=np.float32)
+        rgb = np.empty((n, 3), dtype=np.uint16) if has_rgb else None
+
+        pos = 0
+        for chunk in reader.chunk_iterator(chunk_size):
+            m = len(chunk)
+            x = np.asarray(chunk.x, dtype=np.float64)
+            y = np.asarray(chunk.y, dtype=np.float64)
+            if to_metric is not None: x, y = to_metric.transform(x, y)
+            xyz[pos:pos + m, 0] = x - origin[0]
+            xyz[pos:pos + m, 1] = y - origin[1]
+            xyz[pos:pos + m, 2] = (np.asarray(chunk.z, dtype=np.float64) - base_elevation) * z_exaggeration - origin[2]
+            if has_rgb:
+                rgb[pos:pos + m] = np.column_stack([chunk.red, chunk.green, chunk.blue])
+            pos += m
+
+    xyz = xyz[:pos]
+    if has_rgb:
+        rgb = rgb[:pos]
+        # Kolory 16-bitowe (wg specyfikacji) albo 8-bitowe zapisane w polach 16-bitowych
+        rgb = (rgb >> 8 if rgb.max() > 255 else rgb).astype(np.uint8)
+    return origin, xyz, rgb, crs
+
+
+def _write_pnts(path, positions, rgb, rtc_center):
+    """Plik pnts: POSITION float32 względem RTC_CENTER (ECEF) + RGB uint8."""
+    n = len(positions)
+    table = {"POINTS_LENGTH": n, "RTC_CENTER": [float(v) for v in rtc_center],
+             "POSITION": {"byteOffset": 0}, "RGB": {"byteOffset": n * 12}}
+    table_json = json.dumps(table, separators=(",", ":")).encode("utf-8")
+    table_json += b" " * ((8 - (28 + len(table_json)) % 8) % 8)
+    body = positions.astype("<f4").tobytes() + np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()
+    body += b"\0" * ((8 - len(body) % 8) % 8)
+    header = struct.pack("<4sIIIIII", b"pnts", 1, 28 + len(table_json) + len(body),
+                         len(table_json), len(body), 0, 0)
+    with open(path, "wb") as f:
+        f.write(header + table_json + body)
+
+
+def build_pointcloud_tiles(las_path, out_dir, node_points=60000, cells=128, max_depth=12,
+                           chunk_size=1_000_000, base_elevation=0.0, z_exaggeration=1.0):
+    """
+    Buduje tileset 3D Tiles w out_dir (poprzednia zawartość usuwana).
+      node_points - węzeł z nie więcej punktami staje się liściem (wszystkie punkty),
+      cells       - siatka próbkowania węzła (cells^3 komórek, jeden punkt na komórkę).
+    Zwraca słownik: points, nodes, depth, center (lon, lat), tileset (ścieżka).
+    """
+    if laspy is None or Transformer is None:
+        raise ImportError("Kafle chmury punktów wymagają laspy i pyproj.")
+
+    origin, xyz, rgb, crs = _read_points(las_path, chunk_size, base_elevation, z_exaggeration)
+    if not len(xyz):
+        raise ValueError(f"Pusta chmura punktów: {las_path}")
+    if rgb is None:
+        rgb = apply_ramp(normalize(xyz[:, 2]), HYPSO_RAMP)
+
+    to_ecef = Transformer.from_crs(crs.to_3d(), "EPSG:4978", always_xy=True)
+    to_lonlat = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+
+    if os.path.exists(out_dir): shutil.rmtree(out_dir)
+    os.makedirs(os.path.join(out_dir, "nodes"))
+
+    def ecef(local):
+        p = local.astype(np.float64) + origin
+        return np.column_stack(to_ecef.transform(p[:, 0], p[:, 1], p[:, 2]))
+
+    # Sześcian korzenia w metrach (x, y i przewyższone z w tym samym układzie)
+    lo_data, hi_data = xyz.min(axis=0).astype(np.float64), xyz.max(axis=0).astype(np.float64)
+    root_size = float((hi_data - lo_data).max()) or 1.0
+    nodes = {}
+    depth_max = 0
+    stack = [("r", lo_data, root_size, np.arange(len(xyz)), 0)]
+    while stack:
+        name, lo, size, idx, depth = stack.pop()
+        pts = xyz[idx]
+        leaf = len(idx) <= node_points or depth >= max_depth
+        if leaf:
+            chosen, rest = idx, idx[:0]
+        else:
+            # Próbka przestrzenna: pierwszy punkt w każdej komórce voxel
+            cell = np.clip(((pts - lo) / (size / cells)).astype(np.int64), 0, cells - 1)
+            keys = (cell[:, 0] * cells + cell[:, 1]) * cells + cell[:, 2]
+            _, first = np.unique(keys, return_index=True)
+            keep = np.zeros(len(idx), dtype=bool)
+            keep[first] = True
+            chosen, rest = idx[keep], idx[~keep]
+
+        positions = ecef(xyz[chosen])
+        rtc = positions.mean(axis=0)
+        _write_pnts(os.path.join(out_dir, "nodes", f"{name}.pnts"), positions - rtc, rgb[chosen], rtc)
+
+        center = ecef((lo + size / 2)[None, :])[0]
+        nodes[name] = {
+            "boundingVolume": {"sphere": [float(v) for v in center] + [size * 0.8661 * 1.01]},
+            "geometricError": 0.0 if leaf or not len(rest) else size / cells,
+            "refine": "ADD",
+            "content": {"uri": f"nodes/{name}.pnts"},
+            "children": [],
+        }
+        depth_max = max(depth_max, depth)
+        if name != "r":
+            nodes[name[:-1]]["children"].append(nodes[name])
+
+        if len(rest):
+            half = size / 2
+            octant = ((xyz[rest] - lo) >= half).astype(np.int64) @ np.array([4, 2, 1])
+            for o in range(8):
+                sub = rest[octant == o]
+                if len(sub):
+                    child_lo = lo + half * np.array([(o >> 2) & 1, (o >> 1) & 1, o & 1])
+                    stack.append((f"{name}{o}", child_lo, half, sub, depth + 1))
+
+    for node in nodes.values():
+        if not node["children"]: del node["children"]
+
+    tileset_path = os.path.join(out_dir, "tileset.json")
+    with open(tileset_path, "w", encoding="utf-8") as f:
+        json.dump({"asset": {"version": "1.0"}, "geometricError": root_size, "root": nodes["r"]}, f)
+
+    mid = origin + (lo_data + hi_data) / 2
+    lon, lat = to_lonlat.transform(mid[0], mid[1])
+    return {"points": int(len(xyz)), "nodes": len(nodes), "depth": depth_max,
+            "center": [float(lon), float(lat)], "tileset": tileset_path}
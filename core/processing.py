@@ -1,23 +1,121 @@
 import os
 import sys
 import subprocess
-from osgeo import gdal, ogr, osr
+from concurrent.futures import as_completed
+from osgeo import gdal, ogr, osr, gdal_array
+import re
 import json
+import numpy as np
+
+from core.parallel import process_pool
 
 try:
     import rasterio
     import geopandas as gpd
+    from core.data_io import load_vector, save_vector, iter_vector_batches
 except ImportError:
     rasterio = None
     gpd = None
 
 gdal.UseExceptions()
 
+# =============================================================================
+#  SILNIK KAFLOWY DEM (wiele procesów)
+# =============================================================================
+
+def _iter_tiles(xsize, ysize, tile_size, halo=1):
+    """
+    Dzieli raster na kafle. Zwraca pary: okno kafla (xoff, yoff, w, h)
+    oraz okno odczytu powiększone o 'halo' pikseli (przycięte do rastra).
+    """
+    for yoff in range(0, ysize, tile_size):
+        for xoff in range(0, xsize, tile_size):
+            w = min(tile_size, xsize - xoff)
+            h = min(tile_size, ysize - yoff)
+            rx, ry = max(0, xoff - halo), max(0, yoff - halo)
+            rw = min(xsize, xoff + w + halo) - rx
+            rh = min(ysize, yoff + h + halo) - ry
+            yield (xoff, yoff, w, h), (rx, ry, rw, rh)
+
+def _dem_tile_worker(src_path, mode, options, tile, read_win):
+    """Proces roboczy: DEMProcessing na jednym kaflu (z halo) w pamięci."""
+    gdal.UseExceptions()
+    xoff, yoff, w, h = tile
+    rx, ry, rw, rh = read_win
+
+    src = gdal.Translate("", src_path, format="MEM", srcWin=[rx, ry, rw, rh])
+    opts = gdal.DEMProcessingOptions(format="MEM", **options)
+    res = gdal.DEMProcessing("", src, mode, options=opts)
+    band = res.GetRasterBand(1)
+    # Odcinamy halo - zostaje tylko rdzeń kafla
+    arr = band.ReadAsArray(xoff - rx, yoff - ry, w, h)
+    return tile, arr, band.GetNoDataValue()
+
+def compute_dem_tiled(src_path, out_path, mode, options, workers=None, tile_size=1024, out_format="GTiff"):
+    """
+    Kaflowa wersja gdal.DEMProcessing. Kafle z 1-pikselowym halo liczone są
+    równolegle w puli procesów i składane w jeden GeoTIFF (lub COG).
+    Operatory DEM są lokalne (okno 3x3), więc wynik jest identyczny
+    z pojedynczym wywołaniem na całym rastrze.
+    """
+    src = gdal.Open(src_path)
+    xsize, ysize = src.RasterXSize, src.RasterYSize
+    gt, proj = src.GetGeoTransform(), src.GetProjection()
+    src = None
+
+    tiles = list(_iter_tiles(xsize, ysize, tile_size))
+    is_cog = out_format.upper() == "COG"
+    tmp_path = out_path + ".tmp.tif" if is_cog else out_path
+    print(f"[GDAL] {mode}: {len(tiles)} kafli {tile_size}px, procesy: {workers or 'auto'}")
+
+    out_ds = None
+    out_band = None
+
+    def write(result):
+        nonlocal out_ds, out_band
+        (xoff, yoff, _, _), arr, nodata = result
+        if out_ds is None:
+            drv = gdal.GetDriverByName("GTiff")
+            if os.path.exists(tmp_path): drv.Delete(tmp_path)
+            out_ds = drv.Create(
+                tmp_path, xsize, ysize, 1,
+                gdal_array.NumericTypeCodeToGDALTypeCode(arr.dtype),
+                options=["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"]
+            )
+            out_ds.SetGeoTransform(gt)
+            out_ds.SetProjection(proj)
+            out_band = out_ds.GetRasterBand(1)
+            if nodata is not None: out_band.SetNoDataValue(nodata)
+        out_band.WriteArray(arr, xoff, yoff)
+
+    try:
+        if len(tiles) == 1 or workers == 1:
+            for tile, read_win in tiles:
+                write(_dem_tile_worker(src_path, mode, options, tile, read_win))
+        else:
+            with process_pool(workers) as pool:
+                futures = [pool.submit(_dem_tile_worker, src_path, mode, options, t, r) for t, r in tiles]
+                for fut in as_completed(futures):
+                    write(fut.result())
+        out_ds.FlushCache()
+    finally:
+        out_band = None
+        out_ds = None
+
+    if is_cog:
+        gdal.Translate(out_path, tmp_path, format="COG", creationOptions=["COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"])
+        gdal.GetDriverByName("GTiff").Delete(tmp_path)
+    print(f"✅ Wynik zapisano: {out_path}")
+
 # =============================================================================
 #  ANALIZY RASTROWE (GDAL)
 # =============================================================================
 
-def compute_slope_raster(src_path, out_path, z_factor=1.0):
+def compute_slope_raster(src_path, out_path, z_factor=1.0, workers=None, tile_size=1024, out_format="GTiff"):
+
+    if workers:
+        options = dict(computeEdges=True, slopeFormat="degree", scale=z_factor)
+        return compute_dem_tiled(src_path, out_path, "slope", options, workers, tile_size, out_format)
 
     print(f"[GDAL] Slope (Z-Factor={z_factor})...")
     try:
@@ -33,7 +131,11 @@ def compute_slope_raster(src_path, out_path, z_factor=1.0):
         print(f" Błąd GDAL Slope: {e}")
         raise e
 
-def compute_aspect_raster(src_path, out_path, z_factor=1.0):
+def compute_aspect_raster(src_path, out_path, z_factor=1.0, workers=None, tile_size=1024, out_format="GTiff"):
+
+    if workers:
+        options = dict(computeEdges=True, scale=z_factor)
+        return compute_dem_tiled(src_path, out_path, "aspect", options, workers, tile_size, out_format)
 
     print(f"[GDAL] Aspect (Z-Factor={z_factor})...")
     try:
@@ -48,7 +150,11 @@ def compute_aspect_raster(src_path, out_path, z_factor=1.0):
         print(f" Błąd GDAL Aspect: {e}")
         raise e
 
-def compute_hillshade_raster(src_path, out_path, z_factor=1.0, az=315.0, alt=45.0):
+def compute_hillshade_raster(src_path, out_path, z_factor=1.0, az=315.0, alt=45.0, workers=None, tile_size=1024, out_format="GTiff"):
+
+    if workers:
+        options = dict(computeEdges=True, azimuth=az, altitude=alt, scale=z_factor)
+        return compute_dem_tiled(src_path, out_path, "hillshade", options, workers, tile_size, out_format)
 
     print(f"[GDAL] Hillshade (Z={z_factor}, Az={az}, Alt={alt})...")
     try:
@@ -65,11 +171,239 @@ def compute_hillshade_raster(src_path, out_path, z_factor=1.0, az=315.0, alt=45.
         print(f"❌ Błąd GDAL Hillshade: {e}")
         raise e
 
+# =============================================================================
+#  ANALIZA TERENU W JEDNYM PRZEBIEGU (NumPy)
+# =============================================================================
+
+TERRAIN_PRODUCTS = ("slope", "aspect", "hillshade", "curvature")
+
+def _terrain_block(block, valid, ewres, nsres, z_factor, az, alt, products):
+    """
+    Liczy wybrane pochodne DEM dla bloku z 1-pikselowym halo.
+    Gradient (Horn, jak w gdaldem) liczony jest raz i współdzielony przez produkty.
+    """
+    a, b, c = block[:-2, :-2], block[:-2, 1:-1], block[:-2, 2:]
+    d, e, f = block[1:-1, :-2], block[1:-1, 1:-1], block[1:-1, 2:]
+    g, h, i = block[2:, :-2], block[2:, 1:-1], block[2:, 2:]
+
+    # Wspólny gradient: wschód-zachód i południe-północ (w wierszach rastra)
+    we = (c + 2 * f + i) - (a + 2 * d + g)
+    sn = (g + 2 * h + i) - (a + 2 * b + c)
+
+    # Komórka jest poprawna tylko, gdy całe okno 3x3 ma dane
+    ok = valid[1:-1, 1:-1].copy()
+    for win in (valid[:-2, :-2], valid[:-2, 1:-1], valid[:-2, 2:], valid[1:-1, :-2],
+                valid[1:-1, 2:], valid[2:, :-2], valid[2:, 1:-1], valid[2:, 2:]):
+        ok &= win
+
+    out = {}
+    if "slope" in products:
+        dx = we / (8.0 * ewres)
+        dy = sn / (8.0 * abs(nsres))
+        slope = np.degrees(np.arctan(np.hypot(dx, dy) / z_factor))
+        out["slope"] = np.where(ok, slope, -9999.0).astype(np.float32)
+
+    if "aspect" in products:
+        aspect = np.degrees(np.arctan2(sn, -we))
+        aspect = np.where(aspect > 90.0, 450.0 - aspect, 90.0 - aspect)
+        aspect[aspect == 360.0] = 0.0
+        flat = (we == 0) & (sn == 0)
+        out["aspect"] = np.where(ok & ~flat, aspect, -9999.0).astype(np.float32)
+
+    if "hillshade" in products:
+        z = 1.0 / z_factor
+        x = -we / (8.0 * ewres)
+        y = sn / (8.0 * nsres)  # nsres ujemne (geotransform), jak w GDAL
+        az_r, alt_r = np.radians(az), np.radians(alt)
+        cang = (254.0 * np.sin(alt_r)
+                - (y * 254.0 * np.cos(az_r) * np.cos(alt_r) * z
+                   - x * 254.0 * np.sin(az_r) * np.cos(alt_r) * z)) / np.sqrt(1 + z * z * (x * x + y * y))
+        shade = np.where(cang <= 0.0, 1.0, 1.0 + cang)
+        out["hillshade"] = np.where(ok, np.clip(np.round(shade), 0, 255), 0).astype(np.uint8)
+
+    if "curvature" in products:
+        # Zevenbergen & Thorne: krzywizna ogólna (konwencja ArcGIS, 1/100 z-jedn.)
+        L2 = ewres * abs(nsres)
+        dd = ((d + f) / 2.0 - e) / L2
+        ee = ((b + h) / 2.0 - e) / L2
+        curv = -2.0 * (dd + ee) * 100.0 / z_factor
+        out["curvature"] = np.where(ok, curv, -9999.0).astype(np.float32)
+
+    return out
+
+def compute_terrain_products(src_path, outputs, z_factor=1.0, az=315.0, alt=45.0, block_size=1024):
+    """
+    Analiza terenu w jednym odczycie DEM: każdy blok czytany jest raz,
+    a slope / aspect / hillshade / curvature liczone ze wspólnego gradientu
+    i zapisywane równocześnie.
+
+    outputs: słownik {produkt: ścieżka_wyjściowa}, np. {"slope": "s.tif", "hillshade": "h.tif"}
+    Na krawędziach rastra brakujące sąsiedztwo uzupełniane jest powieleniem
+    skrajnego wiersza/kolumny.
+    """
+    products = [p for p in outputs if p in TERRAIN_PRODUCTS]
+    unknown = set(outputs) - set(TERRAIN_PRODUCTS)
+    if unknown:
+        raise ValueError(f"Nieznane produkty terenu: {', '.join(sorted(unknown))}")
+    if not products:
+        raise ValueError("Nie wybrano żadnego produktu.")
+
+    print(f"[NumPy] Analiza terenu ({', '.join(products)}), Z-Factor={z_factor}...")
+    src = gdal.Open(src_path)
+    band = src.GetRasterBand(1)
+    xsize, ysize = src.RasterXSize, src.RasterYSize
+    gt = src.GetGeoTransform()
+    ewres, nsres = gt[1], gt[5]
+    nodata = band.GetNoDataValue()
+
+    drv = gdal.GetDriverByName("GTiff")
+    co = ["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER"]
+    out_ds, out_bands = {}, {}
+    try:
+        for p in products:
+            path = outputs[p]
+            if os.path.exists(path): drv.Delete(path)
+            dtype = gdal.GDT_Byte if p == "hillshade" else gdal.GDT_Float32
+            ds = drv.Create(path, xsize, ysize, 1, dtype, options=co)
+            ds.SetGeoTransform(gt)
+            ds.SetProjection(src.GetProjection())
+            ds.GetRasterBand(1).SetNoDataValue(0 if p == "hillshade" else -9999.0)
+            out_ds[p], out_bands[p] = ds, ds.GetRasterBand(1)
+
+        for (xoff, yoff, w, h), (rx, ry, rw, rh) in _iter_tiles(xsize, ysize, block_size):
+            block = band.ReadAsArray(rx, ry, rw, rh).astype(np.float64)
+            # Dopełnienie halo na krawędziach rastra
+            pad = ((yoff - ry == 0) * 1, (yoff + h == ry + rh) * 1,
+                   (xoff - rx == 0) * 1, (xoff + w == rx + rw) * 1)
+            block = np.pad(block, ((pad[0], pad[1]), (pad[2], pad[3])), mode="edge")
+
+            valid = np.isfinite(block)
+            if nodata is not None: valid &= block != nodata
+
+            res = _terrain_block(block, valid, ewres, nsres, z_factor, az, alt, products)
+            for p, arr in res.items():
+                out_bands[p].WriteArray(arr, xoff, yoff)
+
+        for ds in out_ds.values(): ds.FlushCache()
+    finally:
+        out_bands.clear()
+        out_ds.clear()
+        src = None
+
+    for p in products: print(f"✅ {p}: {outputs[p]}")
+    return {p: outputs[p] for p in products}
+
 # =============================================================================
 #  ANALIZY WEKTOROWE
 # =============================================================================
 
-def generate_contours(src_path, out_path, interval=10.0, attr_name="ELEV"):
+def _contour_tile_worker(src_path, read_win, own_rect, interval, has_no_data, no_data_val):
+    """
+    Proces roboczy: warstwice jednego kafla w układzie pikselowym rastra.
+    Kafle zachodzą na siebie o jedną kolumnę/wiersz, więc punkty na wspólnej
+    krawędzi mają identyczne współrzędne. Linie są przycinane do obszaru
+    "własnego" kafla (own_rect), żeby na szwach nie powstawały duplikaty.
+    """
+    import shapely
+    gdal.UseExceptions()
+    rx, ry, rw, rh = read_win
+
+    src = gdal.Translate("", src_path, format="MEM", srcWin=[rx, ry, rw, rh])
+    src.SetGeoTransform((rx, 1.0, 0.0, ry, 0.0, 1.0))
+
+    mem = ogr.GetDriverByName("Memory").CreateDataSource("")
+    lyr = mem.CreateLayer("contours", None, ogr.wkbLineString)
+    lyr.CreateField(ogr.FieldDefn("ELEV", ogr.OFTReal))
+    gdal.ContourGenerate(src.GetRasterBand(1), interval, 0.0, [], has_no_data, no_data_val, lyr, -1, 0)
+
+    result = []
+    for feat in lyr:
+        geom = shapely.from_wkb(bytes(feat.GetGeometryRef().ExportToWkb()))
+        clipped = shapely.clip_by_rect(geom, *own_rect)
+        if clipped.is_empty: continue
+        result.append((feat.GetField(0), shapely.to_wkb(clipped)))
+    return result
+
+def generate_contours_tiled(src_path, out_path, interval=10.0, attr_name="ELEV", workers=None, tile_size=2048):
+    """
+    Warstwice liczone równolegle na kaflach, sklejane na szwach (line_merge)
+    i zapisywane do jednego GPKG z indeksem przestrzennym.
+    """
+    import shapely
+
+    if not out_path.lower().endswith(".gpkg"):
+        raise ValueError("Tryb kaflowy warstwic zapisuje wyłącznie do GPKG.")
+
+    ds = gdal.Open(src_path)
+    xsize, ysize = ds.RasterXSize, ds.RasterYSize
+    gt = ds.GetGeoTransform()
+    proj = ds.GetProjection()
+    no_data_val = ds.GetRasterBand(1).GetNoDataValue()
+    ds = None
+    has_no_data = 1 if no_data_val is not None else 0
+    if not has_no_data: no_data_val = 0.0
+
+    jobs = []
+    for yoff in range(0, ysize, tile_size):
+        for xoff in range(0, xsize, tile_size):
+            w = min(tile_size + 1, xsize - xoff)
+            h = min(tile_size + 1, ysize - yoff)
+            if w < 2 or h < 2: continue  # pasek w całości pokryty przez zakładkę sąsiada
+            # Obszar własny kafla w pikselach: od środka pierwszej do środka ostatniej komórki,
+            # a na brzegach rastra - do samej krawędzi
+            x0 = 0.0 if xoff == 0 else xoff + 0.5
+            y0 = 0.0 if yoff == 0 else yoff + 0.5
+            x1 = float(xsize) if xoff + w >= xsize else xoff + w - 0.5
+            y1 = float(ysize) if yoff + h >= ysize else yoff + h - 0.5
+            jobs.append(((xoff, yoff, w, h), (x0, y0, x1, y1)))
+
+    print(f"[GDAL] Warstwice co {interval}m: {len(jobs)} kafli, procesy: {workers or 'auto'}")
+    parts = {}
+    with process_pool(workers) as pool:
+        futures = [pool.submit(_contour_tile_worker, src_path, win, rect, interval, has_no_data, no_data_val)
+                   for win, rect in jobs]
+        for fut in as_completed(futures):
+            for elev, wkb in fut.result():
+                parts.setdefault(elev, []).append(wkb)
+
+    def to_world(xy):
+        px, py = xy[:, 0], xy[:, 1]
+        return np.column_stack((gt[0] + px * gt[1] + py * gt[2], gt[3] + px * gt[4] + py * gt[5]))
+
+    srs = osr.SpatialReference()
+    if proj: srs.ImportFromWkt(proj)
+
+    drv = ogr.GetDriverByName("GPKG")
+    if os.path.exists(out_path): drv.DeleteDataSource(out_path)
+    out_ds = drv.CreateDataSource(out_path)
+    try:
+        layer_name = os.path.splitext(os.path.basename(out_path))[0]
+        out_layer = out_ds.CreateLayer(layer_name, srs, ogr.wkbLineString, options=["SPATIAL_INDEX=YES"])
+        out_layer.CreateField(ogr.FieldDefn(attr_name, ogr.OFTReal))
+        defn = out_layer.GetLayerDefn()
+
+        count = 0
+        out_layer.StartTransaction()
+        for elev in sorted(parts):
+            lines = shapely.get_parts(shapely.set_precision(shapely.from_wkb(parts[elev]), 1e-6))
+            lines = lines[~shapely.is_empty(lines)]
+            merged = shapely.line_merge(shapely.multilinestrings(lines))
+            merged = shapely.transform(shapely.get_parts(merged), to_world)
+            for geom in merged:
+                feat = ogr.Feature(defn)
+                feat.SetField(attr_name, float(elev))
+                feat.SetGeometry(ogr.CreateGeometryFromWkb(shapely.to_wkb(geom)))
+                out_layer.CreateFeature(feat)
+                count += 1
+        out_layer.CommitTransaction()
+        print(f"✅ Warstwice gotowe ({count} linii).")
+    finally:
+        out_ds = None
+
+def generate_contours(src_path, out_path, interval=10.0, attr_name="ELEV", workers=None, tile_size=2048):
+    if workers:
+        return generate_contours_tiled(src_path, out_path, interval, attr_name, workers, tile_size)
+
     print(f"[GDAL] Warstwice co {interval}m...")
     ds = None
     out_ds = None
@@ -128,34 +462,113 @@ def vector_buffer(src_path, out_path, distance):
             out_feat = None
     out_ds = None
 
-def clip_vector_geopandas(src_path, mask_path, out_path):
-    import geopandas as gpd
-
-    gdf = gpd.read_file(src_path)
-    mask = gpd.read_file(mask_path)
-    
-    if gdf.empty or mask.empty:
+def _buffer_chunk_worker(geoms, distance):
+    """Proces roboczy: bufor dla jednego fragmentu tablicy geometrii."""
+    import shapely
+    return shapely.buffer(geoms, distance)
+
+def vector_buffer_bulk(src_path, out_path, distance, workers=None, chunk_size=100_000):
+    """
+    Bufor wektorowo (Shapely 2): geometrie czytane jako tablica (pyogrio/Arrow),
+    buforowane jednym wywołaniem (lub fragmentami w puli procesów)
+    i zapisywane jednym zapisem. Atrybuty źródła są zachowane.
+    """
+    import shapely
+    from itertools import repeat
+
+    print(f"[Shapely] Bufor {distance}m (wektorowo)...")
+    gdf = load_vector(src_path)
+    geoms = np.asarray(gdf.geometry.array)
+
+    if workers and workers > 1 and len(geoms) > chunk_size:
+        chunks = [geoms[i:i + chunk_size] for i in range(0, len(geoms), chunk_size)]
+        with process_pool(workers) as pool:
+            buffered = np.concatenate(list(pool.map(_buffer_chunk_worker, chunks, repeat(distance))))
+    else:
+        buffered = shapely.buffer(geoms, distance)
+
+    gdf = gdf.set_geometry(gpd.GeoSeries(buffered, index=gdf.index, crs=gdf.crs))
+    save_vector(gdf, out_path)
+    print(f"✅ Zapisano {len(gdf)} buforów: {out_path}")
+
+# Formaty, do których pyogrio dopisuje kolejne porcje (append); pozostałe zapisywane raz
+_APPEND_FORMATS = (".gpkg", ".shp", ".sqlite")
+
+def clip_vector_geopandas(src_path, mask_path, out_path, chunk_size=50_000):
+    """
+    Przycinanie wektora maską, strumieniowo:
+      1. źródło czytane porcjami po chunk_size obiektów, tylko w zasięgu (bbox)
+         maski - filtr w sterowniku,
+      2. w każdej porcji STRtree rozdziela obiekty w całości wewnątrz maski
+         (bez przycinania) od obiektów na granicy (przycinane),
+      3. porcja wyniku zapisywana od razu (GPKG, SHP, SQLite); formaty bez
+         dopisywania (np. GeoJSON) dostają cały wynik jednym zapisem.
+    Jak gpd.clip(keep_geom_type=False): części niższego wymiaru (np. linia
+    ze styku poligonów) pozostają w wyniku jako GeometryCollection.
+    """
+    import shapely
+    import pandas as pd
+    from core.data_io import vector_info
+
+    mask = load_vector(mask_path, columns=[])
+    if mask.empty:
         print("Błąd: Jedna z warstw jest pusta.")
         return
-    if gdf.crs != mask.crs:
-        print(f"Transformacja CRS maski do układu punktów: {gdf.crs}")
-        mask = mask.to_crs(gdf.crs)
 
-    clipped = gpd.clip(gdf, mask)
+    src_crs = vector_info(src_path)["crs"]
+    if src_crs and mask.crs and mask.crs != src_crs:
+        print(f"Transformacja CRS maski do układu punktów: {src_crs}")
+        mask = mask.to_crs(src_crs)
+
+    mask_geom = shapely.union_all(mask.geometry.values)
+    shapely.prepare(mask_geom)
+    stream = os.path.splitext(out_path)[1].lower() in _APPEND_FORMATS
+    if stream and os.path.exists(out_path):
+        os.remove(out_path)
+
+    parts, written, empty = [], 0, None
+    n_bbox = n_inside = n_boundary = 0
+    for gdf in iter_vector_batches(src_path, batch_size=chunk_size, bbox=tuple(mask.total_bounds)):
+        if empty is None: empty = gdf.iloc[[]]
+        if gdf.empty: continue
+        geoms = np.asarray(gdf.geometry.array)
+        tree = shapely.STRtree(geoms)
+        hits = np.sort(tree.query(mask_geom, predicate="intersects"))
+        inside = tree.query(mask_geom, predicate="contains")
+        boundary = np.setdiff1d(hits, inside)
+        n_bbox += len(geoms); n_inside += len(inside); n_boundary += len(boundary)
+
+        out_geoms = geoms.copy()
+        if len(boundary):
+            out_geoms[boundary] = shapely.intersection(geoms[boundary], mask_geom)
+        keep = hits[~shapely.is_empty(out_geoms[hits])]
+        if not len(keep): continue
+
+        part = gdf.iloc[keep].copy()
+        part.geometry = gpd.GeoSeries(out_geoms[keep], index=part.index, crs=gdf.crs)
+        if stream:
+            save_vector(part, out_path, append=written > 0)
+        else:
+            parts.append(part)
+        written += len(part)
 
-    if not clipped.empty:
-        clipped.to_file(out_path)
-        print(f"Sukces! Wycięto {len(clipped)} obiektów.")
-    else:
+    print(f"[STRtree] W bbox: {n_bbox}, wewnątrz: {n_inside}, na granicy: {n_boundary}")
+    if parts:
+        save_vector(gpd.GeoDataFrame(pd.concat(parts, ignore_index=True), crs=parts[0].crs), out_path)
+    if not written:
         print("Wynik przycinania jest pusty - sprawdź czy warstwy są spójne przestrzennie.")
-        clipped.to_file(out_path)
+        if empty is None: empty = load_vector(src_path, max_features=0)
+        save_vector(empty, out_path)
+        return
+
+    print(f"Sukces! Wycięto {written} obiektów.")
 
 def centroids_geopandas(src_path, out_path):
     if not gpd: raise ImportError("Brak GeoPandas")
     print("[GeoPandas] Centroids...")
-    gdf = gpd.read_file(src_path)
+    gdf = load_vector(src_path)
     gdf['geometry'] = gdf.geometry.centroid
-    gdf.to_file(out_path)
+    save_vector(gdf, out_path)
     
 def pdal_info(las_path):
 
@@ -224,77 +637,199 @@ def pdal_generate_dtm(las_path, out_tif, resolution=1.0):
         }
     ]
     _run_pdal_pipeline(pipeline)
-def extract_by_attribute(src_path, out_path, column, value):
-
+_SQL_OPS = {"==": "=", ">": ">", "<": "<", ">=": ">=", "<=": "<="}
+
+def _parse_condition(expr):
+    """'>=10' -> ('>=', '10'); 'Śródmieście' -> ('==', 'Śródmieście')"""
+    expr = str(expr).strip()
+    for op in (">=", "<=", "==", ">", "<", "="):
+        if expr.startswith(op):
+            return ("==" if op in ("==", "=") else op), expr[len(op):].strip()
+    return "==", expr
+
+def _sql_literal(raw, numeric):
+    if not numeric:
+        return "'" + str(raw).replace("'", "''") + "'"
+    try:
+        val = float(raw)
+    except Exception:
+        raise ValueError(f"Nieprawidłowa wartość liczbową w wyrażeniu: {raw}")
+    return repr(int(val)) if val.is_integer() else repr(val)
+
+def _split_values(text):
+    """
+    'A;B;C' -> ['A', 'B', 'C']. Średnik w apostrofach lub cudzysłowie należy do
+    wartości ("'a;b';C" -> ['a;b', 'C']); podwojony znak cudzysłowu to sam znak.
+    """
+    values, buf, quote, i = [], "", None, 0
+    text = str(text)
+    while i < len(text):
+        c = text[i]
+        if quote:
+            if c == quote and text.startswith(quote, i + 1):
+                buf += c
+                i += 1
+            elif c == quote:
+                quote = None
+            else:
+                buf += c
+        elif c in "'\"" and not buf.strip():
+            quote, buf = c, ""
+        elif c == ";":
+            values.append(buf.strip())
+            buf = ""
+        else:
+            buf += c
+        i += 1
+    values.append(buf.strip())
+    return [v for v in values if v]
+
+def build_attribute_filter(conditions, dtypes, combine="AND"):
+    """
+    Buduje klauzulę WHERE wykonywaną w sterowniku (OGR SQL / GPKG / PostGIS).
+    conditions: lista par (kolumna, wyrażenie), łączonych przez combine (AND/OR).
+    Wyrażenie:
+      "10", ">10", "<=5"        - porównanie (==, >, <, >=, <=)
+      ">=10 AND <20"            - kilka warunków na kolumnie liczbowej
+      "A;B;C" lub lista wartości - IN (...)
+    """
+    clauses = []
+    for column, value in conditions:
+        if column not in dtypes:
+            raise ValueError(f"Brak kolumny '{column}' w warstwie.")
+        numeric = str(dtypes[column]).startswith(("int", "uint", "float"))
+        ident = '"' + column.replace('"', '""') + '"'
+
+        if isinstance(value, (list, tuple)) or ";" in str(value):
+            values = value if isinstance(value, (list, tuple)) else _split_values(value)
+            lits = [_sql_literal(str(v).strip(), numeric) for v in values if str(v).strip()]
+            clauses.append(f"{ident} IN ({', '.join(lits)})")
+            continue
+
+        # Teksty porównujemy w całości - nazwy mogą zawierać "and"/"or"
+        parts = re.split(r"\s+(AND|OR)\s+", str(value).strip(), flags=re.I) if numeric else [str(value).strip()]
+        sub = []
+        for k, part in enumerate(parts):
+            if k % 2:
+                sub.append(part.upper())
+                continue
+            op, raw = _parse_condition(part) if numeric else ("==", part)
+            sub.append(f"{ident} {_SQL_OPS[op]} {_sql_literal(raw, numeric)}")
+        clauses.append("(" + " ".join(sub) + ")")
+
+    return f" {combine.strip().upper()} ".join(clauses)
+
+def extract_by_attribute(src_path, out_path, column=None, value=None, conditions=None, combine="AND", layer=None):
+    """
+    Wyodrębnia obiekty spełniające warunek atrybutowy. Warunek tłumaczony jest
+    na WHERE wykonywane w sterowniku (GPKG, PostGIS - po stronie serwera),
+    więc do pamięci trafiają tylko pasujące wiersze.
+    src_path może być ścieżką pliku lub połączeniem "PG:..." (wtedy layer="schemat.tabela").
+    """
     if not gpd:
         raise ImportError("Brak GeoPandas")
 
-    print(f"[GeoPandas] Wyodrębnianie: {column} {value}...")
-    try:
-        gdf = gpd.read_file(src_path)
-
-        expr = str(value).strip()
-        op = "=="
-        raw = expr
-
-        for possible in (">=", "<=", ">", "<"):
-            if expr.startswith(possible):
-                op = possible
-                raw = expr[len(possible):].strip()
-                break
+    from core.data_io import vector_info
 
-        series = gdf[column]
-        if series.dtype == "object":
+    conditions = list(conditions or [])
+    if column is not None:
+        conditions.insert(0, (column, value))
+    if not conditions:
+        raise ValueError("Nie podano warunku ekstrakcji.")
 
-            if op != "==":
+    try:
+        info = vector_info(src_path, layer=layer)
+        dtypes = dict(zip(info["fields"], info["dtypes"]))
+        for col, val in conditions:
+            numeric = str(dtypes.get(col, "")).startswith(("int", "uint", "float"))
+            if col in dtypes and not numeric and not isinstance(val, (list, tuple)) and _parse_condition(val)[0] != "==":
                 raise ValueError(
-                    f"Kolumna '{column}' jest tekstowa – obsługuję tylko porównanie równości."
+                    f"Kolumna '{col}' jest tekstowa – obsługuję tylko porównanie równości."
                 )
-            val = raw
-            mask = series.astype(str) == val
-        else:
 
-            try:
-                val = float(raw)
-            except Exception:
-                raise ValueError(f"Nieprawidłowa wartość liczbową w wyrażeniu: {expr}")
-
-            if op == "==":
-                mask = series == val
-            elif op == ">":
-                mask = series > val
-            elif op == "<":
-                mask = series < val
-            elif op == ">=":
-                mask = series >= val
-            elif op == "<=":
-                mask = series <= val
-            else:
-                mask = series == val
-
-        filtered_gdf = gdf[mask]
+        where = build_attribute_filter(conditions, dtypes, combine)
+        print(f"[OGR] Wyodrębnianie: WHERE {where}")
+        filtered_gdf = load_vector(src_path, layer=layer, where=where)
 
         if len(filtered_gdf) == 0:
-            raise ValueError(f"Brak obiektów spełniających warunek {column} {expr}")
+            raise ValueError(f"Brak obiektów spełniających warunek {where}")
 
-        filtered_gdf.to_file(out_path)
+        save_vector(filtered_gdf, out_path)
         print(f"✅ Zapisano {len(filtered_gdf)} obiektów do: {out_path}")
 
     except Exception as e:
         print(f"❌ Błąd ekstrakcji: {e}")
         raise e
-def validate_geometry(src_path):
+def validate_geometry_layer(src_path, out_invalid=None, out_repaired=None, chunk_size=100_000, max_samples=10):
+    """
+    Walidacja geometrii wektorowo (shapely.is_valid_reason), porcjami po chunk_size
+    obiektów z jednego sekwencyjnego odczytu (iter_vector_batches), więc pamięć
+    nie rośnie z rozmiarem warstwy, a warstwa czytana jest raz.
+
+    out_invalid  - opcjonalna warstwa z błędnymi obiektami i kolumną 'invalid_reason'
+    out_repaired - opcjonalna kopia całej warstwy naprawiona przez make_valid
+
+    Zwraca słownik: total, invalid, errors {klasa błędu: liczba},
+    samples [(nr obiektu, opis)], out_invalid, out_repaired.
+    """
+    import shapely
+    from collections import Counter
+
+    need_attrs = bool(out_invalid or out_repaired)
+    errors = Counter()
+    samples = []
+    total = invalid = 0
+    written_invalid = written_repaired = False
+
+    offset = 0  # numer pierwszego obiektu porcji w całej warstwie
+    for gdf in iter_vector_batches(src_path, batch_size=chunk_size, columns=None if need_attrs else []):
+        if gdf.empty: continue
+
+        geoms = np.asarray(gdf.geometry.array)
+        bad = np.flatnonzero(~shapely.is_valid(geoms))
+        if len(bad):
+            reasons = shapely.is_valid_reason(geoms[bad])
+            reasons = np.array([r if r is not None else "Brak geometrii" for r in reasons], dtype=object)
+            errors.update(r.split("[")[0].strip() for r in reasons)
+            for k in range(min(len(bad), max_samples - len(samples))):
+                samples.append((offset + int(bad[k]), reasons[k]))
+
+            if out_invalid:
+                part = gdf.iloc[bad].copy()
+                part["invalid_reason"] = reasons
+                save_vector(part, out_invalid, append=written_invalid)
+                written_invalid = True
+
+        if out_repaired:
+            fixed = geoms.copy()
+            if len(bad):
+                fixed[bad] = shapely.make_valid(geoms[bad], method="structure", keep_collapsed=False)
+            part = gdf.copy()
+            part.geometry = gpd.GeoSeries(fixed, index=gdf.index, crs=gdf.crs)
+            save_vector(part, out_repaired, append=written_repaired)
+            written_repaired = True
+
+        total += len(gdf)
+        invalid += len(bad)
+        offset += len(gdf)
+
+    return {
+        "total": total,
+        "invalid": invalid,
+        "errors": dict(errors.most_common()),
+        "samples": samples,
+        "out_invalid": out_invalid if written_invalid else None,
+        "out_repaired": out_repaired if written_repaired else None,
+    }
+
+def validate_geometry(src_path, out_invalid=None, out_repaired=None):
 
     if not gpd: return "Brak biblioteki GeoPandas."
     
     print(f"Walidacja geometrii: {src_path}")
     try:
-        gdf = gpd.read_file(src_path)
-        total = len(gdf)
-
-        invalid_mask = ~gdf.is_valid
-        invalid_rows = gdf[invalid_mask]
-        count_invalid = len(invalid_rows)
+        res = validate_geometry_layer(src_path, out_invalid, out_repaired)
+        total, count_invalid = res["total"], res["invalid"]
         
         report = f"--- RAPORT WALIDACJI ---\n"
         report += f"Plik: {os.path.basename(src_path)}\n"
@@ -304,18 +839,22 @@ def validate_geometry(src_path):
         report += "-" * 30 + "\n"
         
         if count_invalid > 0:
-            report += "SZCZEGÓŁY BŁĘDÓW:\n"
-
-            from shapely.validation import explain_validity
-            
-            for idx, row in invalid_rows.iterrows():
-                reason = explain_validity(row.geometry)
-                report += f"ID {idx}: {reason}\n"
-                if idx > 10: # Ograniczamy raport
-                    report += "... i więcej ...\n"
-                    break
-            
-            report += "\nZALECENIE: Użyj funkcji 'Napraw Geometrię' (buffer 0) w QGIS."
+            report += "KLASY BŁĘDÓW:\n"
+            for reason, n in res["errors"].items():
+                report += f"  {reason}: {n}\n"
+
+            report += "\nPRZYKŁADY:\n"
+            for idx, reason in res["samples"]:
+                report += f"Obiekt nr {idx}: {reason}\n"
+            if count_invalid > len(res["samples"]):
+                report += "... i więcej ...\n"
+
+            if res["out_invalid"]:
+                report += f"\nBłędne obiekty zapisano: {res['out_invalid']}"
+            if res["out_repaired"]:
+                report += f"\nNaprawioną kopię (make_valid) zapisano: {res['out_repaired']}"
+            else:
+                report += "\nZALECENIE: Użyj funkcji 'Napraw Geometrię' (buffer 0) w QGIS."
         else:
             report += "✅ WARSTWA POPRAWNA TOPOLOGICZNIE.\nMożna użyć do Mapy Numerycznej."
             
@@ -350,7 +889,7 @@ def polygon_to_line(src_path, out_path):
     print(f"[GeoPandas] Konwersja Poligon -> Linia: {src_path}")
     
     try:
-        gdf = gpd.read_file(src_path)
+        gdf = load_vector(src_path)
 
         if not any(gdf.geom_type.isin(['Polygon', 'MultiPolygon'])):
             print("Ostrzeżenie: Warstwa może nie zawierać poligonów.")
@@ -358,7 +897,7 @@ def polygon_to_line(src_path, out_path):
         gdf['geometry'] = gdf.geometry.boundary
         
         # Zapis
-        gdf.to_file(out_path)
+        save_vector(gdf, out_path)
         print(f"✅ Zapisano linie: {out_path}")
         
     except Exception as e:
@@ -0,0 +1,230 @@
+# core/raster_tiles.py
+"""
+Piramida kafli XYZ (PNG 256x256, EPSG:3857) z rastra jednopasmowego,
+pokolorowana rampą hipsometryczną - zamiast jednego obrazu ImageOverlay.
+
+Budowa przyrostowa: raster źródłowy dzielony jest na bloki, dla każdego liczony
+jest skrót zawartości. Skrót kafla = parametry kolorowania + skróty bloków, które
+pokrywa jego okno źródłowe. manifest.json pamięta skróty kafli, więc przy kolejnym
+eksporcie renderowane są tylko kafle, których okno źródłowe się zmieniło.
+Kafle i skróty bloków liczone są w puli procesów (core.parallel).
+"""
+import os
+import json
+import math
+import hashlib
+import numpy as np
+from osgeo import gdal, osr
+
+from core.parallel import process_pool
+from core.colormap import HYPSO_RAMP, ramp_rgba
+
+gdal.UseExceptions()
+
+TILE_SIZE = 256
+WEB_MERCATOR_HALF = 20037508.342789244
+MANIFEST_VERSION = 2
+
+
+def _tile_bounds(z, x, y):
+    size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    minx = -WEB_MERCATOR_HALF + x * size
+    maxy = WEB_MERCATOR_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _tile_range(bounds, z):
+    minx, miny, maxx, maxy = bounds
+    size = 2 * WEB_MERCATOR_HALF / 2 ** z
+    n = 2 ** z - 1
+    x0 = min(n, max(0, int((minx + WEB_MERCATOR_HALF) // size)))
+    x1 = min(n, max(0, int((maxx + WEB_MERCATOR_HALF) // size)))
+    y0 = min(n, max(0, int((WEB_MERCATOR_HALF - maxy) // size)))
+    y1 = min(n, max(0, int((WEB_MERCATOR_HALF - miny) // size)))
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def _hash_blocks_worker(raster_path, windows):
+    """Proces roboczy: skróty zawartości bloków (xoff, yoff, w, h) pasma 1."""
+    ds = gdal.Open(raster_path)
+    band = ds.GetRasterBand(1)
+    out = []
+    for xoff, yoff, w, h in windows:
+        out.append(hashlib.blake2b(band.ReadRaster(xoff, yoff, w, h), digest_size=16).hexdigest())
+    ds = None
+    return out
+
+
+def _render_tiles_worker(raster_path, tiles, out_dir, vmin, vmax, colors):
+    """Proces roboczy: warp okna kafla do 256x256 (EPSG:3857), kolorowanie, zapis PNG."""
+    from PIL import Image
+
+    ds = gdal.Open(raster_path)
+    nodata = ds.GetRasterBand(1).GetNoDataValue()
+    written = []
+    for z, x, y in tiles:
+        warped = gdal.Warp(
+            "", ds, format="MEM", dstSRS="EPSG:3857", outputBounds=_tile_bounds(z, x, y),
+            width=TILE_SIZE, height=TILE_SIZE, resampleAlg="bilinear", outputType=gdal.GDT_Float32,
+            dstAlpha=True, srcNodata=nodata,
+        )
+        data = warped.GetRasterBand(1).ReadAsArray()
+        mask = (warped.GetRasterBand(2).ReadAsArray() > 0) & np.isfinite(data) & (data != 0)
+        if nodata is not None: mask &= data != nodata
+        warped = None
+
+        path = os.path.join(out_dir, str(z), str(x), f"{y}.png")
+        if not mask.any():
+            if os.path.exists(path): os.remove(path)
+            written.append(False)
+            continue
+        norm = np.clip((data - vmin) / ((vmax - vmin) or 1.0), 0, 1)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.fromarray(ramp_rgba(norm, mask, colors), "RGBA").save(path, optimize=False)
+        written.append(True)
+    ds = None
+    return written
+
+
+def _value_range(ds, max_size=1024):
+    """Zakres wartości z podglądu (jak w add_raster_layer: bez nodata, zer i NaN)."""
+    band = ds.GetRasterBand(1)
+    w, h = ds.RasterXSize, ds.RasterYSize
+    scale = min(1.0, max_size / max(w, h))
+    data = band.ReadAsArray(buf_xsize=max(1, int(w * scale)), buf_ysize=max(1, int(h * scale))).astype(float)
+    mask = np.isfinite(data) & (data != 0)
+    if band.GetNoDataValue() is not None: mask &= data != band.GetNoDataValue()
+    if not mask.any(): return None
+    return float(data[mask].min()), float(data[mask].max())
+
+
+def build_xyz_pyramid(raster_path, out_dir, minzoom=None, maxzoom=None, workers=None,
+                      block_size=512, batch_size=32, colors=HYPSO_RAMP):
+    """
+    Buduje / aktualizuje piramidę out_dir/{z}/{x}/{y}.png.
+    minzoom/maxzoom - domyślnie od zoomu, na którym raster mieści się w ~1 kaflu,
+                      do zoomu odpowiadającego rozdzielczości natywnej.
+    Zwraca słownik: minzoom, maxzoom, bounds (lat/lon), tiles, rendered, skipped.
+    """
+    raster_path = os.path.abspath(raster_path)
+    os.makedirs(out_dir, exist_ok=True)
+    ds = gdal.Open(raster_path)
+    w, h = ds.RasterXSize, ds.RasterYSize
+    gt = ds.GetGeoTransform()
+    value_range = _value_range(ds)
+    if value_range is None:
+        return None
+    vmin, vmax = value_range
+
+    # Zasięg w EPSG:3857 i lat/lon
+    src_srs = osr.SpatialReference(wkt=ds.GetProjection())
+    src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    merc = osr.SpatialReference(); merc.ImportFromEPSG(3857)
+    wgs = osr.SpatialReference(); wgs.ImportFromEPSG(4326)
+    wgs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    sx0, sy1 = gt[0], gt[3]
+    sx1, sy0 = gt[0] + w * gt[1], gt[3] + h * gt[5]
+    to_merc = osr.CoordinateTransformation(src_srs, merc)
+    to_src = osr.CoordinateTransformation(merc, src_srs)
+    merc_bounds = to_merc.TransformBounds(sx0, sy0, sx1, sy1, 21)
+    lonlat = osr.CoordinateTransformation(src_srs, wgs).TransformBounds(sx0, sy0, sx1, sy1, 21)
+
+    res_m = (merc_bounds[2] - merc_bounds[0]) / w
+    if maxzoom is None:
+        maxzoom = max(0, min(22, math.ceil(math.log2(2 * WEB_MERCATOR_HALF / (TILE_SIZE * res_m)))))
+    if minzoom is None:
+        span = max(merc_bounds[2] - merc_bounds[0], merc_bounds[3] - merc_bounds[1])
+        minzoom = max(0, min(maxzoom, int(math.floor(math.log2(2 * WEB_MERCATOR_HALF / span)))))
+
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except Exception:
+            manifest = {}
+
+    stat = os.stat(raster_path)
+    signature = [stat.st_size, stat.st_mtime_ns, minzoom, maxzoom, vmin, vmax, list(colors), MANIFEST_VERSION]
+    if manifest.get("signature") == signature:
+        # Plik i parametry bez zmian - piramida aktualna, bez czytania źródła
+        n = len(manifest.get("tiles", {}))
+        print(f"[XYZ] {os.path.basename(raster_path)}: bez zmian ({n} kafli)")
+        return {"minzoom": minzoom, "maxzoom": maxzoom,
+                "bounds": [[lonlat[1], lonlat[0]], [lonlat[3], lonlat[2]]],
+                "tiles": n, "rendered": 0, "skipped": n}
+
+    # 1. Skróty bloków źródła (równolegle)
+    bw = bh = block_size
+    windows = [(bx, by, min(bw, w - bx), min(bh, h - by)) for by in range(0, h, bh) for bx in range(0, w, bw)]
+    chunks = [windows[i:i + 256] for i in range(0, len(windows), 256)]
+    with process_pool(workers) as pool:
+        hashes = [hx for part in pool.map(_hash_blocks_worker, [raster_path] * len(chunks), chunks) for hx in part]
+    block_hash = {(xoff // bw, yoff // bh): hx for (xoff, yoff, _, _), hx in zip(windows, hashes)}
+    nbx, nby = math.ceil(w / bw), math.ceil(h / bh)
+
+    params = json.dumps([MANIFEST_VERSION, vmin, vmax, list(colors)])
+
+    def tile_hash(z, x, y):
+        # Okno źródłowe kafla (+1 px na resampling) -> zakres bloków
+        try:
+            tb = to_src.TransformBounds(*_tile_bounds(z, x, y), 21)
+            if not all(math.isfinite(v) for v in tb): raise ValueError
+            px0 = int(math.floor((tb[0] - gt[0]) / gt[1])) - 1
+            px1 = int(math.ceil((tb[2] - gt[0]) / gt[1])) + 1
+            py0 = int(math.floor((tb[3] - gt[3]) / gt[5])) - 1
+            py1 = int(math.ceil((tb[1] - gt[3]) / gt[5])) + 1
+        except Exception:
+            # Kafel poza obszarem ważności układu źródła (niskie zoomy) - cały raster
+            px0, py0, px1, py1 = 0, 0, w, h
+        bx0, bx1 = max(0, px0 // bw), min(nbx - 1, px1 // bw)
+        by0, by1 = max(0, py0 // bh), min(nby - 1, py1 // bh)
+        hsh = hashlib.blake2b(params.encode("utf-8"), digest_size=16)
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                hsh.update(block_hash[(bx, by)].encode("ascii"))
+        return hsh.hexdigest()
+
+    # 2. Lista kafli i porównanie z manifestem
+    old = manifest.get("tiles", {})
+
+    current, todo = {}, []
+    for z in range(minzoom, maxzoom + 1):
+        xs, ys = _tile_range(merc_bounds, z)
+        for x in xs:
+            for y in ys:
+                key = f"{z}/{x}/{y}"
+                hx = tile_hash(z, x, y)
+                prev = old.get(key)
+                if prev == "empty:" + hx or (prev == hx and os.path.exists(os.path.join(out_dir, str(z), str(x), f"{y}.png"))):
+                    current[key] = prev
+                    continue
+                current[key] = hx
+                todo.append((z, x, y))
+
+    # Kafle spoza nowego zasięgu
+    for key in set(old) - set(current):
+        png = os.path.join(out_dir, *key.split("/")) + ".png"
+        if os.path.exists(png): os.remove(png)
+
+    # 3. Renderowanie zmienionych kafli (równolegle, paczkami)
+    print(f"[XYZ] {os.path.basename(raster_path)}: z{minzoom}-{maxzoom}, kafli {len(current)}, do renderowania {len(todo)}")
+    if todo:
+        batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+        n = len(batches)
+        with process_pool(workers) as pool:
+            results = pool.map(_render_tiles_worker, [raster_path] * n, batches, [out_dir] * n,
+                               [vmin] * n, [vmax] * n, [colors] * n)
+            for batch, written in zip(batches, results):
+                for (z, x, y), ok in zip(batch, written):
+                    key = f"{z}/{x}/{y}"
+                    if not ok: current[key] = "empty:" + current[key]
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"source": raster_path, "signature": signature, "tiles": current}, f)
+    ds = None
+
+    return {"minzoom": minzoom, "maxzoom": maxzoom,
+            "bounds": [[lonlat[1], lonlat[0]], [lonlat[3], lonlat[2]]],
+            "tiles": len(current), "rendered": len(todo), "skipped": len(current) - len(todo)}
@@ -0,0 +1,115 @@
+# core/terrain_mesh.py
+"""
+Siatka terenu z DEM zamiast chmury punktów (jeden punkt na komórkę rastra):
+  - rtin_mesh          - adaptacyjna triangulacja RTIN (jak Martini): trójkąty dzielone
+                         tylko tam, gdzie błąd wysokości przekracza max_error,
+  - encode_terrain_rgb - wysokości zapisane binarnie jako PNG Terrain-RGB (Mapbox),
+                         z którego deck.gl TerrainLayer buduje w przeglądarce tę samą
+                         siatkę RTIN (meshMaxError).
+Obliczenia wektorowe w NumPy - poziom po poziomie drzewa trójkątów.
+"""
+import numpy as np
+
+# Dekoder Terrain-RGB: h = -10000 + (R * 65536 + G * 256 + B) * 0.1
+TERRAIN_RGB_DECODER = {"rScaler": 6553.6, "gScaler": 25.6, "bScaler": 0.1, "offset": -10000}
+
+
+def pad_to_rtin(dem):
+    """Siatka 2^k x 2^k -> 2^k+1 x 2^k+1 (powielenie ostatniego wiersza/kolumny, jak loaders.gl)."""
+    return np.pad(np.asarray(dem, dtype=np.float32), ((0, 1), (0, 1)), mode="edge")
+
+
+def _triangle_coords(tile):
+    """
+    Wierzchołki a, b (przeciwprostokątna) wszystkich trójkątów drzewa RTIN.
+    Trójkąt id (od 2): najmłodszy bit wybiera połowę kafla, kolejne bity - lewe/prawe dziecko.
+    """
+    ids = np.arange(2, tile * tile * 2, dtype=np.int64)
+    odd = (ids & 1).astype(bool)
+    ax = np.where(odd, 0, tile); ay = ax.copy()
+    bx = np.where(odd, tile, 0); by = bx.copy()
+    cx = np.where(odd, tile, 0); cy = np.where(odd, 0, tile)
+
+    cur = ids.copy()
+    while True:
+        cur >>= 1
+        active = cur > 1
+        if not active.any(): break
+        mx, my = (ax + bx) >> 1, (ay + by) >> 1
+        left = active & ((cur & 1) == 1)
+        right = active & ((cur & 1) == 0)
+        ax, ay, bx, by = (np.where(left, cx, np.where(right, bx, ax)), np.where(left, cy, np.where(right, by, ay)),
+                          np.where(left, ax, np.where(right, cx, bx)), np.where(left, ay, np.where(right, cy, by)))
+        cx, cy = np.where(active, mx, cx), np.where(active, my, cy)
+    return ids, ax, ay, bx, by
+
+
+def rtin_errors(dem):
+    """
+    Mapa błędów RTIN: dla każdego węzła siatki - największy błąd interpolacji
+    w poddrzewie trójkątów, których przeciwprostokątną dzieli ten węzeł.
+    dem: kwadrat (2^k+1) x (2^k+1).
+    """
+    dem = np.asarray(dem, dtype=np.float32)
+    size = dem.shape[0]
+    tile = size - 1
+    if dem.shape != (size, size) or tile & (tile - 1):
+        raise ValueError(f"RTIN wymaga siatki (2^k+1) x (2^k+1), otrzymano {dem.shape}")
+
+    ids, ax, ay, bx, by = _triangle_coords(tile)
+    level = np.floor(np.log2(ids)).astype(np.int64)
+    flat = dem.ravel()
+    errors = np.zeros(size * size, dtype=np.float32)
+
+    # Od najgłębszego poziomu: błędy dzieci muszą być gotowe przed rodzicami
+    for lvl in range(level.max(), level.min() - 1, -1):
+        sel = level == lvl
+        tax, tay, tbx, tby = ax[sel], ay[sel], bx[sel], by[sel]
+        mx, my = (tax + tbx) >> 1, (tay + tby) >> 1
+        mid = my * size + mx
+        interp = (flat[tay * size + tax] + flat[tby * size + tbx]) / 2
+        np.maximum.at(errors, mid, np.abs(interp - flat[mid]))
+        if lvl < level.max():
+            cx, cy = mx + my - tay, my + tax - mx
+            left = ((tay + cy) >> 1) * size + ((tax + cx) >> 1)
+            right = ((tby + cy) >> 1) * size + ((tbx + cx) >> 1)
+            np.maximum.at(errors, mid, np.maximum(errors[left], errors[right]))
+    return errors.reshape(size, size)
+
+
+def rtin_mesh(dem, max_error=1.0, errors=None):
+    """
+    Siatka RTIN dla zadanego maksymalnego błędu wysokości (w jednostkach dem).
+    Zwraca (vertices (V, 3) float32: kolumna, wiersz, wysokość; triangles (T, 3) uint32).
+    """
+    dem = np.asarray(dem, dtype=np.float32)
+    if errors is None: errors = rtin_errors(dem)
+    size = dem.shape[0]
+    tile = size - 1
+
+    tris = np.array([[0, 0, tile, tile, tile, 0], [tile, tile, 0, 0, 0, tile]], dtype=np.int64)
+    done = []
+    while len(tris):
+        ax, ay, bx, by, cx, cy = tris.T
+        mx, my = (ax + bx) >> 1, (ay + by) >> 1
+        split = (np.abs(ax - cx) + np.abs(ay - cy) > 1) & (errors[my, mx] > max_error)
+        done.append(tris[~split])
+        s, mx, my = tris[split], mx[split], my[split]
+        tris = np.concatenate([
+            np.column_stack([s[:, 4], s[:, 5], s[:, 0], s[:, 1], mx, my]),
+            np.column_stack([s[:, 2], s[:, 3], s[:, 4], s[:, 5], mx, my]),
+        ])
+
+    tris = np.concatenate(done)
+    corner = np.stack([tris[:, 1] * size + tris[:, 0], tris[:, 3] * size + tris[:, 2],
+                       tris[:, 5] * size + tris[:, 4]], axis=1)
+    nodes, inverse = np.unique(corner.ravel(), return_inverse=True)
+    rows, cols = np.divmod(nodes, size)
+    vertices = np.column_stack([cols, rows, dem.ravel()[nodes]]).astype(np.float32)
+    return vertices, inverse.reshape(-1, 3).astype(np.uint32)
+
+
+def encode_terrain_rgb(heights):
+    """Wysokości [m] -> RGB uint8 (Terrain-RGB, rozdzielczość 0.1 m)."""
+    v = np.clip(np.rint((np.asarray(heights, dtype=np.float64) + 10000) * 10), 0, 2 ** 24 - 1).astype(np.uint32)
+    return np.stack([(v >> 16) & 255, (v >> 8) & 255, v & 255], axis=-1).astype(np.uint8)
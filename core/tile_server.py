@@ -0,0 +1,189 @@
+# core/tile_server.py
+"""
+Kafle wektorowe (Mapbox Vector Tiles) generowane w PostGIS przez ST_AsMVT.
+Adres kafla: /tiles/{schemat}.{tabela}/{z}/{x}/{y}.pbf
+Cache dwupoziomowy: LRU w pamięci + pliki .pbf na dysku. Katalog dyskowy zawiera
+"wersję" tabeli (oid + liczniki zmian z pg_stat_user_tables), więc po zmianie
+danych kafle generowane są od nowa bez ręcznego czyszczenia - katalogi starszych
+wersji usuwane są po zapisaniu pierwszego kafla nowej wersji.
+"""
+import os
+import re
+import time
+import shutil
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
+
+from core.db_iface import _quote_ident
+
+TILE_ROUTE = re.compile(r"^/tiles/(?P<layer>[\w\-]+\.[\w\-]+|[\w\-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$")
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+# Typy kolumn, których ST_AsMVT nie zapisze jako atrybut
+_SKIP_TYPES = ("bytea", "USER-DEFINED", "ARRAY", "json", "jsonb")
+
+
+class MVTTileProvider:
+    def __init__(self, connector, cache_dir=None, memory_tiles=2048, extent=4096, buffer=64,
+                 version_check_s=5.0):
+        """
+        connector     - PostGISConnector (kafle pobierane ze wspólnej puli połączeń)
+        cache_dir     - katalog cache dyskowego (None = tylko pamięć)
+        memory_tiles  - pojemność LRU w pamięci
+        extent/buffer - parametry ST_AsMVTGeom
+        """
+        self.db = connector
+        self.cache_dir = cache_dir
+        self.memory_tiles = memory_tiles
+        self.extent = extent
+        self.buffer = buffer
+        self.version_check_s = version_check_s
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._layers = {}
+        self._reported = set()  # warstwy z już zgłoszonym błędem (bez powtarzania dla każdego kafla)
+        self._pruned = set()  # (warstwa, wersja), dla których usunięto starsze wersje z dysku
+        self.stats = {"memory": 0, "disk": 0, "db": 0}
+        if self.db.engine is None: self.db.connect()
+
+    @staticmethod
+    def tile_url(layer, base_url="http://localhost:8000"):
+        """Szablon URL kafli dla Leaflet / deck.gl MVTLayer."""
+        return f"{base_url}/tiles/{layer}/{{z}}/{{x}}/{{y}}.pbf"
+
+    def _layer_info(self, layer):
+        """Geometria, SRID, atrybuty i wersja tabeli (odświeżane co version_check_s)."""
+        info = self._layers.get(layer)
+        if info and time.monotonic() - info["checked"] < self.version_check_s:
+            return info
+
+        schema, _, name = layer.rpartition(".")
+        schema = schema or "public"
+        with self.db.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT f_geometry_column, srid FROM geometry_columns "
+                     "WHERE f_table_schema = :s AND f_table_name = :t LIMIT 1"),
+                {"s": schema, "t": name}
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"Brak warstwy wektorowej {schema}.{name}")
+            cols = conn.execute(
+                text("SELECT column_name, data_type FROM information_schema.columns "
+                     "WHERE table_schema = :s AND table_name = :t ORDER BY ordinal_position"),
+                {"s": schema, "t": name}
+            ).fetchall()
+            version = conn.execute(
+                text("SELECT relid::bigint, n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables "
+                     "WHERE schemaname = :s AND relname = :t"),
+                {"s": schema, "t": name}
+            ).fetchone()
+
+        if not row[1]:
+            # SRID 0 - układ nieznany; zgadywanie (np. 3857) dałoby kafle w złym miejscu
+            raise ValueError(f"Warstwa {schema}.{name} nie ma SRID (0) - ustaw go przez UpdateGeometrySRID")
+        attrs = [c for c, t in cols if c != row[0] and t not in _SKIP_TYPES]
+        info = {
+            "ident": f"{_quote_ident(schema)}.{_quote_ident(name)}",
+            "geom": _quote_ident(row[0]), "srid": row[1], "attrs": attrs,
+            "version": f"{version[0]}_{version[1]}" if version else "0",
+            "checked": time.monotonic(),
+        }
+        if info.get("version") != (self._layers.get(layer) or {}).get("version"):
+            with self._lock:
+                for key in [k for k in self._lru if k[0] == layer]:
+                    del self._lru[key]
+        self._layers[layer] = info
+        return info
+
+    def _query(self, info, layer, z, x, y):
+        g = f"t.{info['geom']}"
+        envelope = "b.geom" if info["srid"] == 3857 else f"ST_Transform(b.geom, {info['srid']})"
+        geom_3857 = g if info["srid"] == 3857 else f"ST_Transform({g}, 3857)"
+        attrs = "".join(f", t.{_quote_ident(c)}" for c in info["attrs"])
+        sql = f"""
+            WITH b AS (SELECT ST_TileEnvelope(:z, :x, :y) AS geom),
+            mvtgeom AS (
+                SELECT ST_AsMVTGeom({geom_3857}, b.geom, :extent, :buffer, true) AS geom{attrs}
+                FROM {info['ident']} t, b
+                WHERE {g} && {envelope}
+            )
+            SELECT ST_AsMVT(mvtgeom.*, :name, :extent, 'geom') FROM mvtgeom
+        """
+        with self.db.engine.connect() as conn:
+            data = conn.execute(text(sql), {"z": z, "x": x, "y": y, "extent": self.extent,
+                                            "buffer": self.buffer, "name": layer.split(".")[-1]}).scalar()
+        return bytes(data) if data else b""
+
+    def get_tile(self, layer, z, x, y):
+        """Zwraca kafel MVT (bytes, pusty gdy brak obiektów)."""
+        info = self._layer_info(layer)
+        key = (layer, info["version"], z, x, y)
+
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats["memory"] += 1
+                return self._lru[key]
+
+        path = None
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, layer, info["version"], str(z), str(x), f"{y}.pbf")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.stats["disk"] += 1
+                self._remember(key, data)
+                return data
+
+        data = self._query(info, layer, z, x, y)
+        self.stats["db"] += 1
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            if (layer, info["version"]) not in self._pruned:
+                self._prune_versions(layer, info["version"])
+        self._remember(key, data)
+        return data
+
+    def _prune_versions(self, layer, keep):
+        """Usuwa z cache dyskowego katalogi wersji warstwy innych niż keep."""
+        with self._lock:
+            if (layer, keep) in self._pruned: return
+            self._pruned.add((layer, keep))
+        layer_dir = os.path.join(self.cache_dir, layer)
+        stale = [d for d in os.listdir(layer_dir) if d != keep and os.path.isdir(os.path.join(layer_dir, d))]
+        for d in stale:
+            shutil.rmtree(os.path.join(layer_dir, d), ignore_errors=True)
+        if stale:
+            print(f"[MVT] {layer}: usunięto {len(stale)} nieaktualnych wersji cache")
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._lru[key] = data
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.memory_tiles:
+                self._lru.popitem(last=False)
+
+    def handle(self, path):
+        """
+        Obsługa ścieżki HTTP. Zwraca (status, body) albo None, gdy ścieżka nie jest kaflem.
+        """
+        m = TILE_ROUTE.match(path.split("?", 1)[0])
+        if not m:
+            return None
+        z, x, y = int(m["z"]), int(m["x"]), int(m["y"])
+        if z > 30 or x >= 2 ** z or y >= 2 ** z:
+            return 400, b""
+        try:
+            return 200, self.get_tile(m["layer"], z, x, y)
+        except KeyError:
+            return 404, b""
+        except ValueError as e:
+            if m["layer"] not in self._reported:
+                self._reported.add(m["layer"])
+                print(f"[MVT] {e}")
+            return 422, b""
@@ -11,13 +11,87 @@ import numpy as np
 import geopandas as gpd
 import pandas as pd
 from folium.plugins import MarkerCluster
+from jinja2 import Template
 from osgeo import gdal
+from core.data_io import load_vector, vector_info
+from core.generalize import generalize_vector
+from core.build_cache import BuildCache
+
+VECTORGRID_JS = "https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js"
+
+
+class VectorTileLayer(folium.map.Layer):
+    """
+    Warstwa kafli wektorowych (MVT) w Leaflet przez Leaflet.VectorGrid.
+    Styl jak w GeoJSON (style_params z GUI), popup z atrybutami po kliknięciu,
+    etykieta (labelField) jako dymek po najechaniu.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.vectorGrid.protobuf({{ this.url|tojson }}, {
+            rendererFactory: L.canvas.tile,
+            interactive: true,
+            maxNativeZoom: {{ this.maxzoom }},
+            vectorTileLayerStyles: { {{ this.layer_id|tojson }}: {{ this.style|tojson }} }
+        });
+        {% if this.icon_url %}
+        {{ this.get_name() }}.options.vectorTileLayerStyles[{{ this.layer_id|tojson }}].icon =
+            L.icon({iconUrl: {{ this.icon_url|tojson }}, iconSize: [{{ this.icon_size }}, {{ this.icon_size }}]});
+        {% endif %}
+        {{ this.get_name() }}.on('click', function(e) {
+            var p = e.layer.properties || {}, rows = '';
+            for (var k in p) {
+                if (p[k] !== null && p[k] !== '') rows += '<tr><th>' + k + '</th><td>' + p[k] + '</td></tr>';
+            }
+            L.popup({maxWidth: 300}).setLatLng(e.latlng)
+                .setContent("<table style='font-size:11px;'>" + rows + "</table>")
+                .openOn({{ this._parent.get_name() }});
+        });
+        {% if this.label_field %}
+        var {{ this.get_name() }}_tip = null;
+        {{ this.get_name() }}.on('mouseover', function(e) {
+            var v = (e.layer.properties || {})[{{ this.label_field|tojson }}];
+            if (v === undefined || v === null || v === '') return;
+            {{ this.get_name() }}_tip = L.tooltip({direction: 'top', className: 'halo-label'})
+                .setLatLng(e.latlng).setContent(String(v)).addTo({{ this._parent.get_name() }});
+        });
+        {{ this.get_name() }}.on('mouseout', function() {
+            if ({{ this.get_name() }}_tip) { {{ this._parent.get_name() }}.removeLayer({{ this.get_name() }}_tip); }
+        });
+        {% endif %}
+        {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, url, layer_id, style, name, label_field=None, icon_url=None, icon_size=30, maxzoom=14):
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = "VectorTileLayer"
+        self.url = url
+        self.layer_id = layer_id
+        self.style = style
+        self.label_field = label_field
+        self.icon_url = icon_url
+        self.icon_size = icon_size
+        self.maxzoom = maxzoom
 
 class WebMapGenerator:
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, generalize_zoom=None):
+        """
+        generalize_zoom - zoom, dla którego upraszczane i kwantyzowane są warstwy
+                          osadzane jako GeoJSON (None = pełna geometria, domyślnie).
+                          Jedna tolerancja na cały eksport - przy oddalaniu mapy poza
+                          przedział tego zoomu geometria jest zbyt szczegółowa, przy
+                          przybliżaniu - widocznie uproszczona.
+        """
         self.data_dir = os.path.abspath(data_dir)
         self.cache_dir = os.path.join(self.data_dir, "web_cache")
         if not os.path.exists(self.cache_dir): os.makedirs(self.cache_dir)
+        self.generalize_zoom = generalize_zoom
+        self.generalization_report = []
+        # Cache budowania: artefakty warstw kluczowane skrótem zawartości źródła i parametrów
+        self.build_cache = BuildCache(self.cache_dir)
+        self.build_stats = {"reused": 0, "rebuilt": 0}
+        self._layer_keys = []
 
 
         self.m = folium.Map(location=[51.75, 18.09], zoom_start=12, tiles="OpenStreetMap")
@@ -38,15 +112,150 @@ class WebMapGenerator:
         """
         self.m.get_root().header.add_child(folium.Element(halo_css))
 
-    def _is_cached_valid(self, src_path, cache_path):
-        if not os.path.exists(cache_path): return False
-        return os.path.getmtime(src_path) <= os.path.getmtime(cache_path)
+    def _count(self, reused):
+        self.build_stats["reused" if reused else "rebuilt"] += 1
+
+    @staticmethod
+    def _tile_style(style_params, geom_dim):
+        """style_params z GUI -> styl Leaflet.VectorGrid (lista stylów = kilka obrysów)."""
+        color = style_params.get('color', '#3388ff')
+        if style_params.get('doubleLine'):
+            return [
+                {'color': color, 'weight': style_params['weight'], 'opacity': 1.0},
+                {'color': style_params['inner_color'], 'weight': style_params['inner_weight'], 'opacity': 1.0},
+            ]
+        style = {'color': color, 'weight': style_params.get('weight', 2), 'dashArray': style_params.get('dashArray')}
+        if geom_dim == 0:
+            style.update(radius=2, weight=1, fill=True, fillColor=color, fillOpacity=1.0)
+        elif geom_dim == 2:
+            style.update(fill=True, fillColor=style_params.get('fillColor', color),
+                         fillOpacity=style_params.get('fillOpacity', 0.4))
+        return style
+
+    def _build_mvt_pyramid(self, vector_path, layer_id, minzoom=0, maxzoom=14):
+        """
+        Piramida kafli MVT (sterownik GDAL MVT) w web_cache/tiles/<layer_id>/{z}/{x}/{y}.pbf.
+        Kafle bez kompresji gzip - statyczny serwer nie ustawia Content-Encoding.
+        Przebudowa tylko, gdy zmieniła się zawartość źródła lub zakres zoomu.
+        """
+        import shutil
+        slot = f"tiles/{layer_id}"
+        key = self.build_cache.key("mvt", self.build_cache.digest(vector_path), "EPSG:3857", minzoom, maxzoom)
+        reused = self.build_cache.get(slot, key) is not None
+        if not reused:
+            out_dir = os.path.join(self.cache_dir, "tiles", layer_id)
+            if os.path.exists(out_dir): shutil.rmtree(out_dir)
+            os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+            gdal.VectorTranslate(
+                out_dir, vector_path, format="MVT", dstSRS="EPSG:3857", layerName=layer_id,
+                datasetCreationOptions=[f"MINZOOM={minzoom}", f"MAXZOOM={maxzoom}", "COMPRESS=NO",
+                                        "FORMAT=DIRECTORY", "TILE_EXTENSION=pbf", "MAX_SIZE=1000000"],
+            )
+            self.build_cache.put(slot, key, files=[f"{slot}/metadata.json"])
+        self._count(reused)
+        self._layer_keys.append(key)
+        return f"web_cache/tiles/{layer_id}/{{z}}/{{x}}/{{y}}.pbf"
+
+    def add_vector_tile_layer(self, layer_name, style_params=None, vector_path=None, tile_url=None,
+                              layer_id=None, minzoom=0, maxzoom=14):
+        """
+        Warstwa jako kafle wektorowe zamiast GeoJSON w HTML:
+          vector_path - plik, z którego budowana jest statyczna piramida MVT w web_cache,
+          tile_url    - gotowe kafle (np. /tiles/... z PostGIS), layer_id = nazwa warstwy w kaflu.
+        """
+        if not style_params: style_params = {}
+        safe_id = "".join(c if c.isalnum() else "_" for c in (layer_id or layer_name)).strip("_") or "layer"
+        if tile_url is None:
+            if not vector_path or not os.path.exists(vector_path): return False
+            tile_url = self._build_mvt_pyramid(vector_path, safe_id, minzoom, maxzoom)
+            layer_id = safe_id
+
+        # geomType z GUI: 0 punkt, 1 linia, 2 poligon (QgsWkbTypes.GeometryType)
+        geom_dim = style_params.get('geomType', 2)
+        svg_url = style_params.get('svgUrl') if geom_dim == 0 else None
+
+        self._layer_keys.append(["tiles", layer_name, tile_url, layer_id, style_params, minzoom, maxzoom])
+        if not getattr(self, "_vectorgrid_loaded", False):
+            self.m.get_root().header.add_child(folium.JavascriptLink(VECTORGRID_JS))
+            self._vectorgrid_loaded = True
+
+        VectorTileLayer(
+            tile_url, layer_id, self._tile_style(style_params, geom_dim), layer_name,
+            label_field=style_params.get('labelField'), icon_url=svg_url,
+            icon_size=style_params.get('weight', 30), maxzoom=maxzoom
+        ).add_to(self.m)
+        return True
+
+    def _prepare_geojson(self, vector_path):
+        """
+        Geometrie i atrybuty warstwy gotowe do osadzenia (EPSG:4326, po generalizacji),
+        zapisane w web_cache/built. Przy niezmienionej zawartości źródła artefakt
+        wczytywany jest jako JSON, bez GeoPandas. Zwraca (geojson_data, dynamic_cols, klucz) lub None.
+        """
+        import hashlib
+        base = os.path.splitext(os.path.basename(vector_path))[0]
+        path_id = hashlib.sha1(os.path.abspath(vector_path).encode("utf-8")).hexdigest()[:8]
+        slot = f"built/{base}_{path_id}.geojson"
+        key = self.build_cache.key("geojson", self.build_cache.digest(vector_path), "EPSG:4326", self.generalize_zoom)
+
+        art = self.build_cache.get(slot, key)
+        if art is not None:
+            with open(os.path.join(self.cache_dir, slot), encoding="utf-8") as f:
+                geojson_data = json.load(f)
+            if art.get("stats"): self.generalization_report.append(dict(art["stats"], cached=True))
+            self._count(True)
+            return geojson_data, art["dynamic_cols"], key
 
-    def add_vector_layer(self, vector_path, layer_name, style_params=None):
-        import os, json
+        stats = None
+        if self.generalize_zoom is not None:
+            gdf, stats = generalize_vector(vector_path, self.generalize_zoom, cache_dir=self.cache_dir,
+                                           geometry_column='geom')
+            self.generalization_report.append(stats)
+        else:
+            gdf = load_vector(vector_path)
+        if gdf.empty: return None
+        if 'geom' in gdf.columns: gdf.set_geometry('geom', inplace=True)
+        gdf = gdf[gdf.geometry.notnull()].explode(index_parts=False)
+        if gdf.crs != "EPSG:4326": gdf = gdf.to_crs("EPSG:4326")
+
+        for col in gdf.columns:
+            if pd.api.types.is_datetime64_any_dtype(gdf[col]) or gdf[col].dtype == 'object':
+                gdf[col] = gdf[col].astype(str).replace('None', '')
+
+        dynamic_cols = [c for c in gdf.columns if c != 'geometry' and gdf[c].nunique() > 1]
+        raw = gdf.to_json()
+        os.makedirs(os.path.join(self.cache_dir, "built"), exist_ok=True)
+        with open(os.path.join(self.cache_dir, slot), "w", encoding="utf-8") as f:
+            f.write(raw)
+        self.build_cache.put(slot, key, files=[slot], dynamic_cols=dynamic_cols,
+                             stats=dict(stats, cached=False) if stats else None)
+        self._count(False)
+        return json.loads(raw), dynamic_cols, key
+
+    def add_vector_layer(self, vector_path, layer_name, style_params=None, mode="geojson", max_inline_features=5000):
+        """
+        mode: "geojson" - geometria osadzona w HTML (domyślnie; działa też z file://),
+              "tiles"   - piramida MVT w web_cache + Leaflet.VectorGrid (względne URL-e
+                          kafli - mapa musi być otwierana przez serwer HTTP),
+              "auto"    - kafle, gdy warstwa ma więcej niż max_inline_features obiektów
+                          i nie ma etykiet (labelField) - etykiety stałe są tylko w GeoJSON.
+        """
         if not os.path.exists(vector_path): return False
         if not style_params: style_params = {}
 
+        if mode == "auto":
+            try:
+                large = vector_info(vector_path)["features"] > max_inline_features
+                mode = "tiles" if large and not style_params.get('labelField') else "geojson"
+            except Exception:
+                mode = "geojson"
+        if mode == "tiles":
+            try:
+                return self.add_vector_tile_layer(layer_name, style_params, vector_path=vector_path)
+            except Exception as e:
+                print(f"Błąd kafli MVT ({layer_name}): {e}")
+                return False
+
         s_color = style_params.get('color', '#3388ff')
         s_weight = style_params.get('weight', 2)
         s_svg_url = style_params.get('svgUrl')
@@ -54,18 +263,10 @@ class WebMapGenerator:
         label_field = style_params.get('labelField')
 
         try:
-            gdf = gpd.read_file(vector_path)
-            if gdf.empty: return False
-            if 'geom' in gdf.columns: gdf.set_geometry('geom', inplace=True)
-            gdf = gdf[gdf.geometry.notnull()].explode(index_parts=False)
-            if gdf.crs != "EPSG:4326": gdf = gdf.to_crs("EPSG:4326")
-
-            for col in gdf.columns:
-                if pd.api.types.is_datetime64_any_dtype(gdf[col]) or gdf[col].dtype == 'object':
-                    gdf[col] = gdf[col].astype(str).replace('None', '')
-
-            dynamic_cols = [c for c in gdf.columns if c != 'geometry' and gdf[c].nunique() > 1]
-            geojson_data = json.loads(gdf.to_json())
+            prepared = self._prepare_geojson(vector_path)
+            if prepared is None: return False
+            geojson_data, dynamic_cols, key = prepared
+            self._layer_keys.append(["geojson", layer_name, key, style_params])
             actual_geom = geojson_data["features"][0]["geometry"]["type"]
 
             if "Point" in actual_geom:
@@ -116,16 +317,48 @@ class WebMapGenerator:
             return True
         except: return False
 
-    def add_raster_layer(self, raster_path, layer_name):
-        import numpy as np
+    def add_raster_tile_layer(self, raster_path, layer_name, workers=None, minzoom=None, maxzoom=None):
+        """
+        Raster jako piramida kafli XYZ w web_cache/xyz/<nazwa> (przyrostowo, w puli procesów).
+        Przeglądarka pobiera tylko widoczne kafle w rozdzielczości bieżącego zoomu.
+        """
+        from core.raster_tiles import build_xyz_pyramid
+
+        base_name = os.path.splitext(os.path.basename(raster_path))[0]
+        safe = "".join(c if c.isalnum() else "_" for c in base_name)
+        info = build_xyz_pyramid(raster_path, os.path.join(self.cache_dir, "xyz", safe),
+                                 minzoom=minzoom, maxzoom=maxzoom, workers=workers)
+        if info is None: return False
+        print(f"[XYZ] {layer_name}: wyrenderowano {info['rendered']}, bez zmian {info['skipped']}")
+        self._count(info["rendered"] == 0)
+        self._layer_keys.append(["xyz", layer_name, self.build_cache.digest(raster_path),
+                                 info["minzoom"], info["maxzoom"]])
+
+        folium.TileLayer(
+            tiles=f"web_cache/xyz/{safe}/{{z}}/{{x}}/{{y}}.png", attr=layer_name, name=layer_name,
+            overlay=True, control=True, opacity=0.8, min_zoom=0, max_zoom=22,
+            max_native_zoom=info["maxzoom"], bounds=info["bounds"],
+        ).add_to(self.m)
+        return True
+
+    def add_raster_layer(self, raster_path, layer_name, mode="overlay", workers=None):
+        """
+        mode: "overlay" - jeden obraz PNG (max 2000 px) jako ImageOverlay,
+              "tiles"   - piramida kafli XYZ (add_raster_tile_layer).
+        """
         from PIL import Image
-        import matplotlib.pyplot as plt
+        from core.colormap import HYPSO_RAMP, normalize, ramp_rgba
+
+        if mode == "tiles":
+            return self.add_raster_tile_layer(raster_path, layer_name, workers=workers)
 
         base_name = os.path.splitext(os.path.basename(raster_path))[0]
         filename = f"{base_name}_colored.png"
         cache_path = os.path.join(self.cache_dir, filename)
+        key = self.build_cache.key("overlay", self.build_cache.digest(raster_path), "EPSG:4326", HYPSO_RAMP, 2000)
 
-        if not self._is_cached_valid(raster_path, cache_path):
+        art = self.build_cache.get(filename, key)
+        if art is None:
             ds = gdal.Open(raster_path)
 
             w, h = ds.RasterXSize, ds.RasterYSize
@@ -135,21 +368,19 @@ class WebMapGenerator:
             mask = (data != ds.GetRasterBand(1).GetNoDataValue()) & (data != 0) & (np.isfinite(data))
             if not np.any(mask): return False
 
-            d_min, d_max = data[mask].min(), data[mask].max()
-            norm = np.clip((data - d_min) / (d_max - d_min), 0, 1)
-            
-            cmap = plt.cm.colors.LinearSegmentedColormap.from_list("h", ["#267300", "#8BD100", "#FFFFBE", "#C88200", "#642800"])
-            rgba = (cmap(norm) * 255).astype(np.uint8)
-            rgba[:, :, 3] = (mask * 255).astype(np.uint8) 
-            
+            rgba = ramp_rgba(normalize(data, mask=mask), mask, HYPSO_RAMP)
             Image.fromarray(rgba, 'RGBA').save(cache_path)
 
-        ds_info = gdal.Open(raster_path)
-        warp = gdal.Warp("", ds_info, options=gdal.WarpOptions(dstSRS="EPSG:4326", format="VRT"))
-        gt = warp.GetGeoTransform()
-        wi, hi = warp.RasterXSize, warp.RasterYSize
-        bounds = [[gt[3] + hi*gt[5], gt[0]], [gt[3], gt[0] + wi*gt[1]]]
-        
+            warp = gdal.Warp("", ds, options=gdal.WarpOptions(dstSRS="EPSG:4326", format="VRT"))
+            gt = warp.GetGeoTransform()
+            wi, hi = warp.RasterXSize, warp.RasterYSize
+            bounds = [[gt[3] + hi*gt[5], gt[0]], [gt[3], gt[0] + wi*gt[1]]]
+            self.build_cache.put(filename, key, files=[filename], bounds=bounds)
+        else:
+            bounds = art["bounds"]
+        self._count(art is not None)
+        self._layer_keys.append(["overlay", layer_name, key])
+
         folium.raster_layers.ImageOverlay(name=layer_name, image=cache_path, bounds=bounds, opacity=0.8, zindex=1).add_to(self.m)
         return True
 
@@ -159,6 +390,7 @@ class WebMapGenerator:
         Dodaje warstwę WMS bezpośrednio do mapy Leaflet.
         """
         try:
+            self._layer_keys.append(["wms", name, url, layers, format])
             folium.raster_layers.WmsTileLayer(
                 url=url,
                 layers=layers,
@@ -174,5 +406,19 @@ class WebMapGenerator:
             print(f"Błąd Folium WMS ({name}): {e}")
             return False
     def save_map(self, output_path):
+        """
+        Zapisuje HTML mapy. Gdy lista warstw i wszystkie ich klucze są takie same jak
+        przy poprzednim zapisie tego pliku, HTML nie jest generowany ponownie.
+        Zwraca True, gdy plik został zapisany.
+        """
         folium.LayerControl(collapsed=False).add_to(self.m)
-        self.m.save(output_path)
\ No newline at end of file
+        slot = os.path.relpath(os.path.abspath(output_path), self.cache_dir).replace(os.sep, "/")
+        key = self.build_cache.key("map", self._layer_keys)
+        written = self.build_cache.get(slot, key) is None
+        if written:
+            self.m.save(output_path)
+            self.build_cache.put(slot, key, files=[slot])
+        self.build_cache.save()
+        print(f"[CACHE] Warstwy: przebudowane {self.build_stats['rebuilt']}, "
+              f"z cache {self.build_stats['reused']}{'' if written else ' (HTML bez zmian)'}")
+        return written
\ No newline at end of file
@@ -1,15 +1,17 @@
        
 import os
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon
+from core.data_io import load_vector, vector_info
+from core.generalize import generalize_vector
+from core.colormap import HYPSO_RAMP, apply_ramp, normalize, ramp_rgba
+from core.terrain_mesh import TERRAIN_RGB_DECODER, encode_terrain_rgb, pad_to_rtin, rtin_mesh
+from core.build_cache import BuildCache
 
-try:
-    import pydeck as pdk
-    HAS_PYDECK = True
-except ImportError:
-    HAS_PYDECK = False
 
 try:
     import pydeck as pdk
@@ -33,9 +35,64 @@ try:
 except ImportError:
     Transformer = None
 
+# Doładowanie chmur punktów jako tablic binarnych (typed arrays) po utworzeniu mapy przez pydeck.
+# Układ bloku: float32 [n, 3] przesunięć (lon, lat, z) względem origin, potem uint8 [n, 3] RGB.
+_BINARY_LOADER = """
+<script>
+(async function () {
+  if (typeof deckInstance === 'undefined') return;
+  const sources = %s;
+  const LNGLAT_OFFSETS = (window.deck && deck.COORDINATE_SYSTEM) ? deck.COORDINATE_SYSTEM.LNGLAT_OFFSETS : 3;
+  console.time('binarne chmury punktów');
+  const layers = await Promise.all(deckInstance.props.layers.map(async (layer) => {
+    const src = sources[layer.id];
+    if (!src) return layer;
+    let buffer;
+    if (src.url) {
+      buffer = await (await fetch(src.url)).arrayBuffer();
+    } else {
+      const raw = atob(src.b64), bytes = new Uint8Array(raw.length);
+      for (let i = 0; i < raw.length; i++) bytes[i] = raw.charCodeAt(i);
+      buffer = bytes.buffer;
+    }
+    return layer.clone({
+      data: {length: src.length, attributes: {
+        getPosition: {value: new Float32Array(buffer, 0, src.length * 3), size: 3},
+        getColor: {value: new Uint8Array(buffer, src.length * 12, src.length * 3), size: 3}
+      }},
+      coordinateSystem: LNGLAT_OFFSETS,
+      coordinateOrigin: src.origin
+    });
+  }));
+  deckInstance.setProps({layers});
+  console.timeEnd('binarne chmury punktów');
+  requestAnimationFrame(() => console.log(
+    'Chmury punktów (binarnie) gotowe: ' + performance.now().toFixed(0) + ' ms od startu strony'));
+})();
+</script>
+"""
+
+# Ten sam pomiar dla chmur osadzonych jako JSON (dane parsowane razem ze stroną)
+_JSON_TIMER = """
+<script>
+if (typeof deckInstance !== 'undefined') requestAnimationFrame(() => console.log(
+  'Chmury punktów (json) gotowe: ' + performance.now().toFixed(0) + ' ms od startu strony'));
+</script>
+"""
+
 class WebMap3DGenerator:
-    def __init__(self):
+    def __init__(self, cache_dir=None, generalize_zoom=None):
+        """
+        cache_dir       - web_cache (geometrie po generalizacji), None = bez cache
+        generalize_zoom - zoom docelowy generalizacji warstw wektorowych
+                          (None = pełna geometria, domyślnie; jedna tolerancja na eksport)
+        """
+        self.cache_dir = cache_dir
+        self.generalize_zoom = generalize_zoom
+        self.generalization_report = []
         self.layers = []
+        # Chmury punktów jako tablice NumPy (id warstwy -> dane); serializowane dopiero w save_map
+        self._point_clouds = {}
         self.osm_layer = pdk.Layer(
             "TileLayer",
             data="https://c.tile.openstreetmap.org/{z}/{x}/{y}.png",
@@ -54,7 +111,15 @@ class WebMap3DGenerator:
     def add_vector_layer_3d(self, vector_path, layer_name, height_col=None, color=[255, 140, 0], base_elevation=0):
         if not HAS_PYDECK or not os.path.exists(vector_path): return False
         try:
-            gdf = gpd.read_file(vector_path)
+            # Wczytujemy tylko geometrię i ewentualną kolumnę wysokości
+            columns = []
+            if isinstance(height_col, str) and height_col in vector_info(vector_path)["fields"]:
+                columns = [height_col]
+            if self.generalize_zoom is not None:
+                gdf, stats = generalize_vector(vector_path, self.generalize_zoom, cache_dir=self.cache_dir, columns=columns)
+                self.generalization_report.append(stats)
+            else:
+                gdf = load_vector(vector_path, columns=columns)
             if gdf.empty: return False
             if gdf.crs != "EPSG:4326": gdf = gdf.to_crs("EPSG:4326")
 
@@ -135,6 +200,41 @@ class WebMap3DGenerator:
         except Exception as e:
             print(f"❌ Błąd wektora 3D ({layer_name}): {e}")
             return False
+    def _add_point_cloud(self, layer_name, lon, lat, z, rgb, point_size):
+        """
+        PointCloudLayer bez danych w momencie tworzenia - pydeck zamieniałby DataFrame
+        na listę słowników od razu. Tablice trafiają do HTML w save_map: jako JSON
+        albo binarnie (binary="sidecar"/"base64").
+        """
+        layer_id = f"pc_{len(self.layers)}"
+        self._point_clouds[layer_id] = {
+            "name": layer_name,
+            "lon": np.asarray(lon, dtype=np.float64), "lat": np.asarray(lat, dtype=np.float64),
+            "z": np.asarray(z, dtype=np.float32), "rgb": np.asarray(rgb).astype(np.uint8),
+        }
+        self.layers.append(pdk.Layer(
+            "PointCloudLayer",
+            [],
+            id=layer_id,
+            get_position=["lon", "lat", "z"],
+            get_color=["r", "g", "b"],
+            point_size=point_size,
+            pickable=True,
+            opacity=1.0
+        ))
+
+    def _point_cloud_frame(self, pc):
+        rgb = pc["rgb"]
+        return self._clean_df(pd.DataFrame({"lon": pc["lon"], "lat": pc["lat"], "z": pc["z"],
+                                            "r": rgb[:, 0], "g": rgb[:, 1], "b": rgb[:, 2]}))
+
+    @staticmethod
+    def _point_cloud_block(pc):
+        """Blok binarny chmury: float32 przesunięcia względem origin (precyzja cm) + uint8 RGB."""
+        origin = [float(pc["lon"].min()), float(pc["lat"].min()), 0.0]
+        offsets = np.column_stack([pc["lon"] - origin[0], pc["lat"] - origin[1], pc["z"]]).astype("<f4")
+        return origin, offsets.tobytes() + np.ascontiguousarray(pc["rgb"]).tobytes()
+
     def _clean_df(self, df):
         """Konwertuje typy numpy na standardowe typy Python dla PyDeck"""
         for col in df.columns:
@@ -143,7 +243,89 @@ class WebMap3DGenerator:
             elif np.issubdtype(df[col].dtype, np.integer):
                 df[col] = df[col].astype(int)
         return df
-    def add_raster_layer_3d(self, raster_path, layer_name, base_elevation=0, z_exaggeration=5):
+    def add_terrain_layer_3d(self, raster_path, layer_name, base_elevation=0, z_exaggeration=5,
+                             mesh_max_error=1.0, grid_size=512):
+        """
+        DEM jako siatka terenu (deck.gl TerrainLayer) zamiast chmury punktów.
+        Wysokości zapisywane są jako PNG Terrain-RGB, tekstura - rampą hipsometryczną
+        (web_cache/terrain). Przeglądarka buduje z nich siatkę RTIN o błędzie
+        <= mesh_max_error [m, po przewyższeniu]; liczba wierzchołków tej siatki jest
+        liczona tutaj tym samym algorytmem (core.terrain_mesh). HTML musi leżeć
+        w katalogu nadrzędnym cache_dir (adresy względne).
+        """
+        if not HAS_PYDECK or not rasterio or not self.cache_dir or not os.path.exists(raster_path): return False
+        from PIL import Image
+        try:
+            cache = BuildCache(self.cache_dir)
+            base = "".join(c if c.isalnum() else "_" for c in os.path.splitext(os.path.basename(raster_path))[0])
+            # Skrót ścieżki: pliki o tej samej nazwie z różnych folderów nie dzielą slotu
+            path_id = hashlib.sha1(os.path.abspath(raster_path).encode("utf-8")).hexdigest()[:8]
+            slot = f"terrain/{base}_{path_id}"
+            key = cache.key("terrain", cache.digest(raster_path), grid_size, float(base_elevation),
+                            float(z_exaggeration), mesh_max_error, HYPSO_RAMP)
+            files = [f"{slot}_elev.png", f"{slot}_tex.png"]
+
+            art = cache.get(slot, key)
+            if art is None:
+                with rasterio.open(raster_path) as src:
+                    transform, width, height = calculate_default_transform(
+                        src.crs, 'EPSG:4326', src.width, src.height, *src.bounds,
+                        dst_width=grid_size, dst_height=grid_size)
+                    dem = np.full((height, width), np.nan, dtype=np.float32)
+                    reproject(
+                        source=rasterio.band(src, 1), destination=dem,
+                        src_transform=src.transform, src_crs=src.crs, src_nodata=src.nodata,
+                        dst_transform=transform, dst_crs='EPSG:4326', dst_nodata=np.nan,
+                        resampling=Resampling.bilinear
+                    )
+                mask = np.isfinite(dem) & (np.abs(dem) > 0.001)
+                if not np.any(mask): return False
+
+                # Wysokość renderowana = (z - baza) * przewyższenie; brak danych -> minimum terenu
+                heights = np.where(mask, (dem - base_elevation) * z_exaggeration, np.nan)
+                heights = np.where(mask, heights, np.nanmin(heights)).astype(np.float32)
+
+                os.makedirs(os.path.join(self.cache_dir, "terrain"), exist_ok=True)
+                Image.fromarray(encode_terrain_rgb(heights), "RGB").save(os.path.join(self.cache_dir, files[0]))
+                Image.fromarray(ramp_rgba(normalize(dem, mask=mask), mask), "RGBA").save(
+                    os.path.join(self.cache_dir, files[1]))
+
+                vertices, triangles = rtin_mesh(pad_to_rtin(heights), mesh_max_error)
+                west, north = transform * (0, 0)
+                east, south = transform * (width, height)
+                art = {"bounds": [west, south, east, north], "vertices": int(len(vertices)),
+                       "triangles": int(len(triangles)), "cells": int(mask.sum())}
+                cache.put(slot, key, files=files, **art)
+                cache.save()
+
+            prefix = os.path.basename(os.path.normpath(self.cache_dir))
+            layer = pdk.Layer(
+                "TerrainLayer",
+                elevation_decoder=TERRAIN_RGB_DECODER,
+                elevation_data=f"{prefix}/{files[0]}",
+                texture=f"{prefix}/{files[1]}",
+                bounds=art["bounds"],
+                mesh_max_error=mesh_max_error,
+            )
+            self.layers.append(layer)
+            west, south, east, north = art["bounds"]
+            self._update_view((south + north) / 2, (west + east) / 2)
+            print(f"[MESH] {layer_name}: {art['cells']:,} komórek -> {art['vertices']:,} wierzchołków, "
+                  f"{art['triangles']:,} trójkątów (błąd <= {mesh_max_error} m)")
+            return True
+        except Exception as e:
+            print(f"Błąd siatki terenu 3D ({layer_name}): {e}")
+            return False
+
+    def add_raster_layer_3d(self, raster_path, layer_name, base_elevation=0, z_exaggeration=5, mode="points",
+                            mesh_max_error=1.0):
+        """
+        mode: "points" - punkt na każdą komórkę (PointCloudLayer, raster max 800 px),
+              "mesh"   - siatka terenu RTIN (add_terrain_layer_3d).
+        """
+        if mode == "mesh":
+            return self.add_terrain_layer_3d(raster_path, layer_name, base_elevation=base_elevation,
+                                             z_exaggeration=z_exaggeration, mesh_max_error=mesh_max_error)
         if not HAS_PYDECK or not rasterio or not os.path.exists(raster_path): return False
         try:
             with rasterio.open(raster_path) as src:
@@ -187,54 +369,69 @@ class WebMap3DGenerator:
                 
                 df['z_final'] = (df['z_raw'] - base_elevation) * z_exaggeration
                 
-                df = self._clean_df(df)
+                # Kolorowanie hipsometryczne wektorowo (LUT), bez apply po każdym punkcie
+                rgb = apply_ramp(normalize(df['z_raw'].to_numpy()), HYPSO_RAMP).astype(int)
+                df['r'], df['g'], df['b'] = rgb[:, 0], rgb[:, 1], rgb[:, 2]
 
-                z_min, z_max = df['z_raw'].min(), df['z_raw'].max()
-                z_range = max(0.1, z_max - z_min)
-                
-                color_stops = [
-                    (0.00, [38, 115, 0]),    
-                    (0.25, [139, 209, 0]),   
-                    (0.50, [255, 255, 190]), 
-                    (0.75, [200, 130, 0]),   
-                    (1.00, [100, 40, 0])     
-                ]
-                
-                def get_interpolated_rgb(val):
-                    n = (val - z_min) / z_range
-                    n = max(0, min(1, n))
-                    for i in range(len(color_stops) - 1):
-                        low_n, low_rgb = color_stops[i]
-                        high_n, high_rgb = color_stops[i+1]
-                        if low_n <= n <= high_n:
-                            t = (n - low_n) / (high_n - low_n)
-                            return [
-                                int(low_rgb[0] + (high_rgb[0]-low_rgb[0])*t),
-                                int(low_rgb[1] + (high_rgb[1]-low_rgb[1])*t),
-                                int(low_rgb[2] + (high_rgb[2]-low_rgb[2])*t)
-                            ]
-                    return color_stops[-1][1]
-
-                colors = df['z_raw'].apply(get_interpolated_rgb).tolist()
-                df[['r', 'g', 'b']] = pd.DataFrame(colors, index=df.index)
-
-                layer = pdk.Layer(
-                    "PointCloudLayer",
-                    df,
-                    get_position=["lon", "lat", "z_final"], 
-                    get_color=["r", "g", "b"],
-                    point_size=3.0, 
-                    pickable=True,
-                    opacity=1.0
-                )
-                self.layers.append(layer)
+                self._add_point_cloud(layer_name, df['lon'], df['lat'], df['z_final'], rgb, point_size=3.0)
                 self._update_view(df['lat'].mean(), df['lon'].mean())
                 return True
         except Exception as e:
             print(f"Błąd ładowania rastra 3D: {e}")
             return False
 
-    def add_lidar_layer_3d(self, las_path, layer_name, max_points=1000000, base_elevation=0, z_exaggeration=5):
+    def add_lidar_lod_layer_3d(self, las_path, layer_name, base_elevation=0, z_exaggeration=5,
+                               node_points=60000, cells=128):
+        """
+        Pełna chmura LAS/LAZ jako drzewo LOD 3D Tiles (core.pointcloud_tiles) w
+        web_cache/pointcloud, wyświetlane przez deck.gl Tile3DLayer - przeglądarka
+        pobiera tylko węzły w widoku. Drzewo budowane raz na zawartość pliku i parametry.
+        HTML musi leżeć w katalogu nadrzędnym cache_dir (adresy względne).
+        """
+        if not HAS_PYDECK or not laspy or not self.cache_dir or not os.path.exists(las_path): return False
+        from core.pointcloud_tiles import build_pointcloud_tiles
+        try:
+            cache = BuildCache(self.cache_dir)
+            base = "".join(c if c.isalnum() else "_" for c in os.path.splitext(os.path.basename(las_path))[0])
+            path_id = hashlib.sha1(os.path.abspath(las_path).encode("utf-8")).hexdigest()[:8]
+            slot = f"pointcloud/{base}_{path_id}"
+            key = cache.key("3dtiles", cache.digest(las_path), float(base_elevation), float(z_exaggeration),
+                            node_points, cells)
+
+            art = cache.get(slot, key)
+            if art is None:
+                info = build_pointcloud_tiles(las_path, os.path.join(self.cache_dir, slot), node_points=node_points,
+                                              cells=cells, base_elevation=base_elevation,
+                                              z_exaggeration=z_exaggeration)
+                art = {"points": info["points"], "nodes": info["nodes"], "depth": info["depth"],
+                       "center": info["center"]}
+                cache.put(slot, key, files=[f"{slot}/tileset.json"], **art)
+                cache.save()
+
+            prefix = os.path.basename(os.path.normpath(self.cache_dir))
+            self.layers.append(pdk.Layer(
+                "Tile3DLayer",
+                data=f"{prefix}/{slot}/tileset.json",
+                point_size=2,
+                opacity=1.0
+            ))
+            self._update_view(art["center"][1], art["center"][0])
+            print(f"[✓] LiDAR LOD: {layer_name} ({art['points']:,} punktów, {art['nodes']} węzłów, "
+                  f"głębokość {art['depth']})")
+            return True
+        except Exception as e:
+            print(f"Błąd kafli LiDAR ({layer_name}): {e}")
+            return False
+
+    def add_lidar_layer_3d(self, las_path, layer_name, max_points=1000000, base_elevation=0, z_exaggeration=5,
+                           mode="sample"):
+        """
+        mode: "sample" - losowa próbka max_points punktów osadzona w mapie,
+              "lod"    - pełna chmura jako drzewo 3D Tiles (add_lidar_lod_layer_3d).
+        """
+        if mode == "lod":
+            return self.add_lidar_lod_layer_3d(las_path, layer_name, base_elevation=base_elevation,
+                                               z_exaggeration=z_exaggeration)
         if not HAS_PYDECK or not laspy or not os.path.exists(las_path): return False
         try:
 
@@ -273,29 +470,9 @@ class WebMap3DGenerator:
             b = ((1 - z_norm) * 255).astype(int)
             g = (z_norm * 40).astype(int) 
 
-
-            df = pd.DataFrame({
-                'lon': lon, 
-                'lat': lat, 
-                'z_val': z_final, 
-                'r': r, 'g': g, 'b': b
-            })
-            df = self._clean_df(df) 
-
- 
-            layer = pdk.Layer(
-                "PointCloudLayer",
-                df,
-                get_position=["lon", "lat", "z_val"],
-                get_color=["r", "g", "b"],
-                point_size=2,
-                pickable=True,
-                opacity=1.0
-            )
-            
-            self.layers.append(layer)
-            self._update_view(lat.mean(), lon.mean())
-            print(f"[✓] LiDAR dodany: {layer_name} ({len(df)} punktów)")
+            self._add_point_cloud(layer_name, lon, lat, z_final, np.column_stack([r, g, b]), point_size=2)
+            self._update_view(np.mean(lat), np.mean(lon))
+            print(f"[✓] LiDAR dodany: {layer_name} ({len(z_final)} punktów)")
             return True
         except Exception as e:
             print(f"Błąd ładowania LiDAR: {e}")
@@ -303,10 +480,52 @@ class WebMap3DGenerator:
             traceback.print_exc()
             return False
 
-    def save_map(self, output_path, map_style="osm"):
- 
+    def save_map(self, output_path, map_style="osm", binary=None):
+        """
+        binary: None       - chmury punktów jako JSON w HTML (każdy punkt = obiekt),
+                "sidecar"  - tablice w plikach <nazwa>_data/<id>.bin obok HTML (wymaga serwera HTTP),
+                "base64"   - te same tablice zakodowane w HTML (działa też z file://).
+        Tryb binarny pomija podpowiedzi (pickable) dla chmur punktów.
+        Warstwy chmur są kopiowane na czas zapisu - self.layers pozostaje bez zmian,
+        więc kolejne save_map (w innym trybie) działa tak samo.
+        """
+        import copy
+        import time
+        import base64
         if not HAS_PYDECK: return False
         try:
+            t0 = time.perf_counter()
+            sources, sidecar_bytes, json_estimate = {}, 0, 0
+            out_dir = os.path.dirname(os.path.abspath(output_path))
+            data_dir_name = os.path.splitext(os.path.basename(output_path))[0] + "_data"
+            save_layers = []
+            for layer in self.layers:
+                pc = self._point_clouds.get(getattr(layer, "id", None))
+                if pc is None:
+                    save_layers.append(layer)
+                    continue
+                layer = copy.copy(layer)
+                save_layers.append(layer)
+                n = len(pc["z"])
+                if not binary:
+                    layer.data = self._point_cloud_frame(pc)
+                    continue
+
+                # Szacunek rozmiaru JSON z próbki 1000 punktów (do porównania w raporcie)
+                sample = self._point_cloud_frame({k: (v[:1000] if k != "name" else v) for k, v in pc.items()})
+                json_estimate += int(len(sample.to_json(orient="records")) * n / max(1, len(sample)))
+                layer.data = []
+                layer.pickable = False
+                origin, block = self._point_cloud_block(pc)
+                sources[layer.id] = {"length": n, "origin": origin}
+                if binary == "base64":
+                    sources[layer.id]["b64"] = base64.b64encode(block).decode("ascii")
+                else:
+                    os.makedirs(os.path.join(out_dir, data_dir_name), exist_ok=True)
+                    with open(os.path.join(out_dir, data_dir_name, f"{layer.id}.bin"), "wb") as f:
+                        f.write(block)
+                    sources[layer.id]["url"] = f"{data_dir_name}/{layer.id}.bin"
+                    sidecar_bytes += len(block)
 
             style_map = {
                 #"osm": None,  # PyDeck domyślnie używa OSM
@@ -329,7 +548,7 @@ class WebMap3DGenerator:
                     opacity=1.0
                 )
                 
-                all_layers = [osm_tile] + self.layers
+                all_layers = [osm_tile] + save_layers
                 
                 deck = pdk.Deck(
                     layers=all_layers,
@@ -339,14 +558,29 @@ class WebMap3DGenerator:
             else:
 
                 deck = pdk.Deck(
-                    layers=self.layers,
+                    layers=save_layers,
                     initial_view_state=self.view_state,
                     map_style=selected_style,
                     tooltip={"text": "Z: {z} m"}
                 )
             
-            deck.to_html(output_path)
-            print(f"[✓] Mapa zapisana: {output_path}")
+            deck.to_html(output_path, open_browser=False)
+            if self._point_clouds:
+                with open(output_path, encoding="utf-8") as f:
+                    html = f.read()
+                loader = _BINARY_LOADER % json.dumps(sources) if sources else _JSON_TIMER
+                html = html.replace("</body>", loader + "</body>", 1) if "</body>" in html else html + loader
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write(html)
+
+            html_mb = os.path.getsize(output_path) / 1e6
+            print(f"[✓] Mapa zapisana: {output_path} ({time.perf_counter() - t0:.1f} s)")
+            if self._point_clouds and binary:
+                print(f"    Chmury punktów ({binary}): HTML {html_mb:.1f} MB + pliki {sidecar_bytes / 1e6:.1f} MB "
+                      f"(jako JSON ok. {json_estimate / 1e6:.1f} MB - szacunek z próbki); "
+                      f"czas wczytania w konsoli przeglądarki")
+            elif self._point_clouds:
+                print(f"    Chmury punktów (json): HTML {html_mb:.1f} MB; czas wczytania w konsoli przeglądarki")
             print(f"    Styl: {map_style} (OSM - bezpłatny)")
             return True
         except Exception as e:
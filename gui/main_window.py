@@ -94,20 +94,25 @@ except ImportError:
 
 # --- IMPORTY CORE ---
 try:
-    from core.db_iface import PostGISConnector
+    from core.db_iface import PostGISConnector, dispose_engines, pg_conninfo
+    from core.db_processing import PostGISBackend
+    from core.tile_server import MVTTileProvider, MVT_CONTENT_TYPE
 except ImportError:
-    PostGISConnector = None
+    PostGISConnector = PostGISBackend = MVTTileProvider = dispose_engines = pg_conninfo = None
+    MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
 
 try:
     from core.processing import (
-        compute_slope_raster, vector_buffer, generate_contours,
+        compute_slope_raster, vector_buffer, vector_buffer_bulk, generate_contours,
         compute_aspect_raster, compute_hillshade_raster, 
         clip_vector_geopandas, centroids_geopandas,
         pdal_generate_dsm, pdal_generate_dtm, pdal_info,
-        extract_by_attribute, clip_raster_gdal, convert_raster_to_jpg, polygon_to_line
+        extract_by_attribute, clip_raster_gdal, convert_raster_to_jpg, polygon_to_line,
+        compute_terrain_products
     )
+    from core.parallel import default_workers
 except ImportError:
-    compute_slope_raster = vector_buffer = generate_contours = None
+    compute_slope_raster = vector_buffer = vector_buffer_bulk = generate_contours = None
     compute_aspect_raster = compute_hillshade_raster = None
     clip_vector_geopandas = centroids_geopandas = None
     pdal_generate_dsm = pdal_generate_dtm = pdal_info = None
@@ -245,6 +250,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.last_point_cloud_layer = None
         self.status = self.statusBar()
         self.server_thread = None # <--- NOWOŚĆ: Uchwyt do wątku serwera
+        self.tile_provider = None # Kafle MVT z PostGIS (po połączeniu z bazą)
         self.httpd = None         # <--- NOWOŚĆ: Uchwyt do serwera
         if self.db:
             self.db.connect()
@@ -273,6 +279,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.identify_tool = ClickIdentifyTool(self.canvas, self)
         self.load_default_basemap()
         
+    def closeEvent(self, event):
+        """Przy zamykaniu okna zamyka współdzielone pule połączeń z bazą."""
+        if dispose_engines:
+            dispose_engines()
+        super().closeEvent(event)
+
     # --- BUILDERS ---
     # --- NOWA METODA POMOCNICZA ---
     def get_target_layer(self, layer_type):
@@ -366,7 +378,9 @@ class MainWindow(QtWidgets.QMainWindow):
         
         l.addWidget(QtWidgets.QLabel("<b>Raster (GDAL):</b>"))
         for t, f in [("⛰ Slope", self.compute_slope_action), ("🧭 Aspect", self.compute_aspect_action),
-                     ("🌑 Hillshade", self.compute_hillshade_action),("n-DSM", self.analyze_ndsm_action), 
+                     ("🌑 Hillshade", self.compute_hillshade_action),
+                     ("🏔 Analiza terenu (wszystkie produkty)", self.compute_terrain_products_action),
+                     ("n-DSM", self.analyze_ndsm_action), 
                      ("〰 Warstwice", self.generate_contours_action), 
                      ("Konwertuj raster na jpg", self.convert_to_jpg_action), 
                      ("Konwertuj poligon na linię", self.polygon_to_line_action),
@@ -375,7 +389,8 @@ class MainWindow(QtWidgets.QMainWindow):
             
         l.addSpacing(10); l.addWidget(QtWidgets.QLabel("<b>Wektor (OGR/Pandas):</b>"))
         for t, f in [("⭕ Bufor", self.compute_buffer_action), ("✂️ Przytnij", self.clip_vector_action),
-                     ("📍 Centroidy", self.compute_centroids_action), ("🔍 Wyodrębnij obiekt (Filtr)", self.extract_feature_action)]:
+                     ("📍 Centroidy", self.compute_centroids_action), ("🔍 Wyodrębnij obiekt (Filtr)", self.extract_feature_action),
+                     ("🩺 Walidacja geometrii", self.validate_geometry_action)]:
             b = QtWidgets.QPushButton(t); b.clicked.connect(f); l.addWidget(b)
 
         l.addSpacing(10); l.addWidget(QtWidgets.QLabel("<b>LiDAR (PDAL):</b>"))
@@ -402,6 +417,10 @@ class MainWindow(QtWidgets.QMainWindow):
         btn_load_db.clicked.connect(self.load_layer_from_postgis_action)
         layout.addWidget(btn_load_db)
 
+        btn_batch = QtWidgets.QPushButton("📦 Import wsadowy (folder)")
+        btn_batch.clicked.connect(self.batch_import_to_postgis_action)
+        layout.addWidget(btn_batch)
+
     def _build_tab_publish(self):
         layout = QtWidgets.QVBoxLayout(self.tab_publish)
         layout.setAlignment(QtCore.Qt.AlignTop)
@@ -414,6 +433,21 @@ class MainWindow(QtWidgets.QMainWindow):
         layout.addSpacing(15)
         
         layout.addWidget(QtWidgets.QLabel("<b>Eksport Interaktywny (Web):</b>"))
+
+        # Generalizacja warstw wektorowych (opcjonalna): upraszczanie i kwantyzacja dla zoomu
+        row_gen = QtWidgets.QHBoxLayout()
+        self.chk_generalize = QtWidgets.QCheckBox("Generalizuj geometrie dla zoomu:")
+        self.spin_generalize_zoom = QtWidgets.QSpinBox()
+        self.spin_generalize_zoom.setRange(0, 22)
+        self.spin_generalize_zoom.setValue(12)
+        self.spin_generalize_zoom.setEnabled(False)
+        self.chk_generalize.toggled.connect(self.spin_generalize_zoom.setEnabled)
+        row_gen.addWidget(self.chk_generalize)
+        row_gen.addWidget(self.spin_generalize_zoom)
+        layout.addLayout(row_gen)
+        # Duże warstwy jako kafle MVT - mapa działa wtedy tylko przez serwer lokalny (localhost:8000)
+        self.chk_vector_tiles = QtWidgets.QCheckBox("Duże warstwy jako kafle MVT (tylko przez serwer lokalny)")
+        layout.addWidget(self.chk_vector_tiles)
         
         btn_update_web = QtWidgets.QPushButton("🔄 Aktualizuj treść mapy (HTML)")
         btn_update_web.clicked.connect(self.update_web_map_content_action)
@@ -438,7 +472,7 @@ class MainWindow(QtWidgets.QMainWindow):
         
         ctrl = QtWidgets.QHBoxLayout()
         self.combo_bench = QtWidgets.QComboBox()
-        self.combo_bench.addItems(["Wektor: Reprojekcja", "Raster: Analiza Slope", "LiDAR: Filtracja Z", "Baza: Deployment ETL"])
+        self.combo_bench.addItems(["Wektor: Reprojekcja", "Raster: Analiza Slope", "LiDAR: Filtracja Z", "Baza: Deployment ETL", "Analizy: Lokalnie vs PostGIS"])
         
         btn = QtWidgets.QPushButton("🚀 Uruchom Zestaw Porównawczy")
         btn.clicked.connect(self.run_benchmark_action)
@@ -526,6 +560,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
         PORT = 8000
         DIRECTORY = self.data_dir
+        window = self
         
         def run_server():
             class Handler(http.server.SimpleHTTPRequestHandler):
@@ -533,10 +568,34 @@ class MainWindow(QtWidgets.QMainWindow):
                     super().__init__(*args, directory=DIRECTORY, **kwargs)
                 def log_message(self, format, *args): pass
 
-            try:
+                def do_GET(self):
+                    # /tiles/{schemat}.{tabela}/{z}/{x}/{y}.pbf - kafle MVT z PostGIS
+                    if self.path.startswith("/tiles/"):
+                        provider = window.tile_provider
+                        try:
+                            res = provider.handle(self.path) if provider else (503, b"")
+                        except Exception as e:
+                            print(f"MVT ERROR {self.path}: {e}")
+                            res = (500, b"")
+                        status, body = res or (404, b"")
+                        self.send_response(status)
+                        self.send_header("Content-Type", MVT_CONTENT_TYPE)
+                        self.send_header("Access-Control-Allow-Origin", "*")
+                        self.send_header("Cache-Control", "no-cache")
+                        self.send_header("Content-Length", str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                        return
+                    super().do_GET()
+
+            class Server(socketserver.ThreadingTCPServer):
                 # Allow_reuse_address pozwala na szybki restart portu
-                socketserver.TCPServer.allow_reuse_address = True
-                with socketserver.TCPServer(("", PORT), Handler) as httpd:
+                # Wątek na żądanie - kafle pobierane równolegle ze wspólnej puli połączeń
+                allow_reuse_address = True
+                daemon_threads = True
+
+            try:
+                with Server(("", PORT), Handler) as httpd:
                     self.httpd = httpd
                     print(f"WEB SERVER: Działa na http://localhost:{PORT}")
                     print(f"WEB ROOT: {DIRECTORY}")
@@ -562,6 +621,7 @@ class MainWindow(QtWidgets.QMainWindow):
             if idx == 1: return engine.run_raster_slope(src)
             if idx == 2: return engine.run_lidar_filter(src)
             if idx == 3: return engine.run_db_deployment(src)
+            if idx == 4: return engine.run_backend_comparison(src)
 
         self.start_worker(run, result_callback=self.display_bench_results)
 
@@ -1456,7 +1516,7 @@ class MainWindow(QtWidgets.QMainWindow):
         out, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz", "", "TIF (*.tif)")
         if out:
             z, ok = QtWidgets.QInputDialog.getDouble(self, "Z-Factor", "1.0 (Metry) / 111120 (Stopnie)", 1.0, 0, 999999, 5)
-            if ok: self.start_worker(compute_slope_raster, s, out, z_factor=z, result_path=out)
+            if ok: self.start_worker(compute_slope_raster, s, out, z_factor=z, workers=default_workers(), result_path=out)
     def analyze_ndsm_action(self):
 
         from qgis.analysis import QgsRasterCalculator, QgsRasterCalculatorEntry
@@ -1516,7 +1576,7 @@ class MainWindow(QtWidgets.QMainWindow):
         out, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz", "", "TIF (*.tif)")
         if out:
             z, ok = QtWidgets.QInputDialog.getDouble(self, "Z-Factor", "1.0 (Metry) / 111120 (Stopnie)", 1.0, 0, 999999, 5)
-            if ok: self.start_worker(compute_aspect_raster, src, out, z_factor=z, result_path=out)
+            if ok: self.start_worker(compute_aspect_raster, src, out, z_factor=z, workers=default_workers(), result_path=out)
 
     def compute_hillshade_action(self):
         l = self.get_target_layer(QgsRasterLayer)
@@ -1530,7 +1590,28 @@ class MainWindow(QtWidgets.QMainWindow):
             if ok: 
                 az, _ = QtWidgets.QInputDialog.getDouble(self, "Az", "Azymut:", 315, 0, 360)
                 alt, _ = QtWidgets.QInputDialog.getDouble(self, "Alt", "Wysokość:", 45, 0, 90)
-                self.start_worker(compute_hillshade_raster, src, out, z_factor=z, az=az, alt=alt, result_path=out)
+                self.start_worker(compute_hillshade_raster, src, out, z_factor=z, az=az, alt=alt, workers=default_workers(), result_path=out)
+
+    def compute_terrain_products_action(self):
+        l = self.get_target_layer(QgsRasterLayer)
+        if not l: 
+            QtWidgets.QMessageBox.warning(self, "Info", "Zaznacz warstwę rastrową.")
+            return
+        src = l.source().split("|")[0]
+        out, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz (nazwa bazowa)", "", "TIF (*.tif)")
+        if not out: return
+        z, ok = QtWidgets.QInputDialog.getDouble(self, "Z-Factor", "1.0 (Metry) / 111120 (Stopnie)", 1.0, 0, 999999, 5)
+        if not ok: return
+
+        base = os.path.splitext(out)[0]
+        outputs = {p: f"{base}_{p}.tif" for p in ("slope", "aspect", "hillshade", "curvature")}
+
+        def finished(paths):
+            for path in paths.values():
+                self.add_layer_smart(QgsRasterLayer(path, os.path.basename(path)))
+
+        self.status.showMessage("Analiza terenu (jeden odczyt DEM)...", 0)
+        self.start_worker(compute_terrain_products, src, outputs, z_factor=z, result_callback=finished)
 
     def generate_contours_action(self):
         l = self.get_target_layer(QgsRasterLayer)
@@ -1541,7 +1622,7 @@ class MainWindow(QtWidgets.QMainWindow):
         out, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz", "", "GPKG (*.gpkg)")
         if out:
             i, ok = QtWidgets.QInputDialog.getDouble(self, "Interwał", "Metry:", 10, 0.1, 10000, 2)
-            if ok: self.start_worker(generate_contours, src, out, interval=i, result_path=out)
+            if ok: self.start_worker(generate_contours, src, out, interval=i, workers=default_workers(), result_path=out)
     def convert_to_jpg_action(self):
         layer = self.get_target_layer(QgsRasterLayer)
         if not layer:
@@ -1558,12 +1639,28 @@ class MainWindow(QtWidgets.QMainWindow):
         
         if out:
             self.start_worker(convert_raster_to_jpg, src, out, result_path=out)
+    def _generalization_summary(self, report):
+        """Wypisuje redukcję rozmiaru per warstwa i zwraca podsumowanie do paska statusu."""
+        if not report: return ""
+        from core.generalize import format_reduction
+        for stats in report:
+            print(f"🗜️ {format_reduction(stats)}{' (cache)' if stats.get('cached') else ''}")
+        before = sum(s["bytes_before"] for s in report)
+        after = sum(s["bytes_after"] for s in report)
+        pct = 100.0 * (1 - after / before) if before else 0.0
+        return f" Geometrie: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB (-{pct:.0f}%)"
+
+    def _web_generalize_zoom(self):
+        """Zoom generalizacji z zakładki publikacji (None = pełna geometria)."""
+        return self.spin_generalize_zoom.value() if self.chk_generalize.isChecked() else None
+
     def generate_3d_web_action(self):
         """Metoda wywoływana po kliknięciu przycisku w aplikacji - obsługuje Wektory, Rastery i LiDAR"""
         from qgis.core import QgsVectorLayer, QgsRasterLayer, QgsPointCloudLayer, QgsVectorFileWriter, QgsProject
         import os, http.server, socketserver, threading
 
-        gen = WebMap3DGenerator()
+        gen = WebMap3DGenerator(cache_dir=os.path.join(self.data_dir, "web_cache"),
+                                generalize_zoom=self._web_generalize_zoom())
         layers = self.canvas.layers() 
         count = 0
 
@@ -1599,12 +1696,16 @@ class MainWindow(QtWidgets.QMainWindow):
 
             elif isinstance(layer, QgsRasterLayer):
                 if os.path.exists(src):
-                    if gen.add_raster_layer_3d(src, layer.name(), base_elevation=base_elevation):
+                    # Siatka terenu (RTIN); gdy się nie uda - dawna chmura punktów
+                    if gen.add_raster_layer_3d(src, layer.name(), base_elevation=base_elevation, mode="mesh") \
+                            or gen.add_raster_layer_3d(src, layer.name(), base_elevation=base_elevation):
                         count += 1
 
             elif isinstance(layer, QgsPointCloudLayer):
                 if os.path.exists(src) and src.lower().endswith(('.las', '.laz')):
-                    if gen.add_lidar_layer_3d(src, layer.name(), max_points=150000, base_elevation=base_elevation):
+                    # Drzewo LOD (3D Tiles) z pełnej chmury; gdy się nie uda - losowa próbka
+                    if gen.add_lidar_layer_3d(src, layer.name(), base_elevation=base_elevation, mode="lod") \
+                            or gen.add_lidar_layer_3d(src, layer.name(), max_points=150000, base_elevation=base_elevation):
                         count += 1
                         print(f"✅ Przesłano LiDAR do 3D: {layer.name()}")
 
@@ -1612,7 +1713,9 @@ class MainWindow(QtWidgets.QMainWindow):
         if count > 0:
             out_html_name = "mapa_3d.html"
             out_path = os.path.join(self.data_dir, out_html_name)
-            gen.save_map(out_path)
+            # Chmury punktów jako tablice binarne obok HTML (strona i tak serwowana przez HTTP)
+            gen.save_map(out_path, binary="sidecar")
+            self.status.showMessage("Mapa 3D gotowa." + self._generalization_summary(gen.generalization_report), 10000)
             
 
             def start_server(path_dir):
@@ -1642,15 +1745,26 @@ class MainWindow(QtWidgets.QMainWindow):
              return
         
         src = l.source().split("|")[0]
+
+        out_invalid = out_repaired = None
+        reply = QtWidgets.QMessageBox.question(
+            self, "Walidacja",
+            "Zapisać warstwę błędnych obiektów (z przyczyną)\noraz naprawioną kopię (make_valid)?",
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+            QtWidgets.QMessageBox.No
+        )
+        if reply == QtWidgets.QMessageBox.Yes:
+            base = os.path.join(self.data_dir, os.path.splitext(os.path.basename(src))[0])
+            out_invalid, out_repaired = f"{base}_bledne.gpkg", f"{base}_naprawione.gpkg"
+            for p in (out_invalid, out_repaired):
+                if os.path.exists(p): os.remove(p)
         
         self.status.showMessage("Trwa walidacja topologii...", 0)
-        QtWidgets.QApplication.processEvents()
-        
 
         from core.processing import validate_geometry 
-        report = validate_geometry(src)
-        
+        self.start_worker(validate_geometry, src, out_invalid, out_repaired, result_callback=self._show_validation_report)
 
+    def _show_validation_report(self, report):
         dlg = QtWidgets.QDialog(self)
         dlg.setWindowTitle("Raport Walidacji")
         dlg.resize(400, 300)
@@ -1666,16 +1780,70 @@ class MainWindow(QtWidgets.QMainWindow):
         self.status.showMessage("Walidacja zakończona.", 5000)
         dlg.exec()
         
+    def _postgis_table(self, layer):
+        """'schemat.tabela' warstwy PostGIS z tej samej bazy co self.db, w przeciwnym razie None."""
+        if not self.db or not PostGISBackend or layer.providerType() != "postgres":
+            return None
+        ds_uri = QgsDataSourceUri(layer.source())
+        try:
+            if ds_uri.database() != self.db.pg_params()["dbname"]:
+                return None
+        except ValueError:
+            return None
+        return f"{ds_uri.schema() or 'public'}.{ds_uri.table()}"
+
+    def _run_on_postgis(self, layer, operation, suffix, *args, **kwargs):
+        """
+        Jeśli warstwa pochodzi z podłączonej bazy PostGIS - wykonuje operację w bazie
+        (PostGISBackend, CREATE TABLE AS) i wczytuje tabelę wynikową. Zwraca True, gdy obsłużono.
+        """
+        src_table = self._postgis_table(layer)
+        if not src_table:
+            return False
+
+        default_name = f"{src_table.split('.')[-1]}_{suffix}"
+        out_table, ok = QtWidgets.QInputDialog.getText(
+            self, "Wynik w PostGIS", "Operacja w bazie danych.\nNazwa tabeli wynikowej:", text=default_name
+        )
+        if not ok or not out_table:
+            return True
+
+        backend = PostGISBackend(self.db)
+        self.status.showMessage(f"PostGIS: {operation} -> {out_table}...", 0)
+        if operation == "clip":
+            # clip(src, mask, out) - kolejność jak w clip_vector_geopandas
+            self.start_worker(backend.clip, src_table, args[0], out_table,
+                              result_callback=self._add_postgis_result_layer)
+        else:
+            self.start_worker(getattr(backend, operation), src_table, out_table, *args,
+                              result_callback=self._add_postgis_result_layer, **kwargs)
+        return True
+
+    def _add_postgis_result_layer(self, table):
+        schema, name = table.split(".", 1)
+        p = self.db.pg_params()
+        uri = QgsDataSourceUri()
+        uri.setConnection(p["host"], p["port"], p["dbname"], p["user"], p["password"])
+        uri.setDataSource(schema, name, "geom")
+        layer = QgsVectorLayer(uri.uri(), name, "postgres")
+        if layer.isValid():
+            self.add_layer_smart(layer)
+            self.status.showMessage(f"Wynik w bazie: {table}", 5000)
+        else:
+            QtWidgets.QMessageBox.warning(self, "Błąd", f"Nie udało się wczytać tabeli wynikowej {table}.")
+
     def compute_buffer_action(self):
         l = self.get_target_layer(QgsVectorLayer)
         if not l: 
             QtWidgets.QMessageBox.warning(self, "Info", "Zaznacz warstwę wektorową.")
             return
         d, ok = QtWidgets.QInputDialog.getDouble(self, "Bufor", "Metry:", 100, 0.1, 100000, 2)
+        if ok and self._run_on_postgis(l, "buffer", "bufor", d):
+            return
         if ok:
             s = l.source().split("|")[0]
             o, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz", "", "SHP (*.shp)")
-            if o: self.start_worker(vector_buffer, s, o, distance=d, result_path=o)
+            if o: self.start_worker(vector_buffer_bulk, s, o, distance=d, workers=default_workers(), result_path=o)
 
     def clip_vector_action(self):
 
@@ -1699,6 +1867,8 @@ class MainWindow(QtWidgets.QMainWindow):
         if not mask_path: return
 
         if isinstance(layer, QgsVectorLayer):
+            if self._run_on_postgis(layer, "clip", "clip", mask_path):
+                return
             out, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz", "", "SHP (*.shp)")
             if out:
                 self.start_worker(clip_vector_geopandas, src_path, mask_path, out, result_path=out)
@@ -1768,6 +1938,8 @@ class MainWindow(QtWidgets.QMainWindow):
         if not l: 
             QtWidgets.QMessageBox.warning(self, "Info", "Zaznacz warstwę wektorową.")
             return
+        if self._run_on_postgis(l, "centroids", "centroidy"):
+            return
         s = l.source().split("|")[0]
         o, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz", "", "SHP (*.shp)")
         if o: self.start_worker(centroids_geopandas, s, o, result_path=o)
@@ -1779,6 +1951,9 @@ class MainWindow(QtWidgets.QMainWindow):
             QtWidgets.QMessageBox.warning(self, "Info", "Zaznacz warstwę poligonową.")
             return
             
+        if self._run_on_postgis(layer, "polygon_to_line", "linie"):
+            return
+
         src = layer.source().split("|")[0]
         
         out, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Zapisz Linie", "", "SHP (*.shp);;GPKG (*.gpkg)")
@@ -1823,16 +1998,19 @@ class MainWindow(QtWidgets.QMainWindow):
             val_str, ok = QtWidgets.QInputDialog.getItem(
                 self,
                 "Krok 2/2",
-                f"Wybierz wartość z '{col_name}':",
+                f"Wybierz wartość z '{col_name}'\n(kilka wartości rozdziel średnikiem, np. A;B;C):",
                 values_str,
                 0,
-                False
+                True
             )
             if not ok:
                 return
 
         
         src_layer = layer
+        if self._run_on_postgis(src_layer, "extract", "wybor", column=col_name, value=val_str):
+            return
+
         out, _ = QtWidgets.QFileDialog.getSaveFileName(
             self,
             "Zapisz wynik",
@@ -1842,8 +2020,16 @@ class MainWindow(QtWidgets.QMainWindow):
 
         if out:
             src = src_layer.source().split("|")[0]
+            src_table = None
+
+            if src_layer.providerType() == "postgres":
+                # Filtr wykonywany po stronie serwera - bez zrzutu warstwy do pliku
+                ds_uri = QgsDataSourceUri(src_layer.source())
+                src = pg_conninfo(ds_uri.host(), ds_uri.port(), ds_uri.database(),
+                                  ds_uri.username(), ds_uri.password())
+                src_table = f"{ds_uri.schema() or 'public'}.{ds_uri.table()}"
 
-            if src_layer.providerType() in ("wfs", "postgres", "memory") or not os.path.exists(src):
+            elif src_layer.providerType() in ("wfs", "memory") or not os.path.exists(src):
                 tmp_dir = os.path.join(self.data_dir, "tmp_extract")
                 if not os.path.exists(tmp_dir):
                     os.makedirs(tmp_dir)
@@ -1880,6 +2066,7 @@ class MainWindow(QtWidgets.QMainWindow):
                 out,
                 column=col_name,
                 value=val_str,
+                layer=src_table,
                 result_path=out
             )
     
@@ -1992,10 +2179,17 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.status.showMessage(f"Łączenie z DB: {dbname}...", 0)
                 QtWidgets.QApplication.processEvents()
                 
+                # Ponowne połączenie: pule poprzedniego połączenia nie są już potrzebne
+                if self.db:
+                    dispose_engines()
                 self.db = PostGISConnector(conn)
 
                 self.db.ensure_database(dbname)
                 self.db.connect()
+                if MVTTileProvider:
+                    self.tile_provider = MVTTileProvider(
+                        self.db, cache_dir=os.path.join(self.data_dir, "web_cache", "mvt")
+                    )
                 
                 caps = self.db.check_advanced_capabilities()
                 
@@ -2003,6 +2197,8 @@ class MainWindow(QtWidgets.QMainWindow):
                 status_msg += f"\n✅ Wektory (PostGIS): {'Dostępne' if caps['postgis'] else 'BŁĄD'}"
                 status_msg += f"\n{'✅' if caps['postgis_raster'] else '❌'} Rastry: {'Dostępne' if caps['postgis_raster'] else 'Brak (zainstaluj postgis_raster)'}"
                 status_msg += f"\n{'✅' if caps['pointcloud'] else '❌'} LiDAR: {'Dostępne' if caps['pointcloud'] else 'Brak (wymaga pgpointcloud)'}"
+                pool = self.db.pool_stats()
+                status_msg += f"\n\n🔌 Pula połączeń: rozmiar {pool['size']}, checkout śr. {pool.get('avg_wait_ms', 0)} ms"
                 
                 self.lbl_db_status.setText("POŁĄCZONO ✅")
                 self.lbl_db_status.setStyleSheet("color: green; font-weight: bold;")
@@ -2332,6 +2528,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
             print(f"\n[✓] Przygotowano {len(scene_data)} warstw do wyświetlenia")
 
+            # Skrypt działa w osobnym interpreterze bez dostępu do core - rampę przekazujemy jako tablicę
+            from core.colormap import HYPSO_RAMP, ramp_table
+            ramp_stops, ramp_rgb = ramp_table(HYPSO_RAMP)
+
             py_code = f"""
 import sys
 import os
@@ -2351,6 +2551,8 @@ except ImportError as e:
 OFFSET_X = {center_x}
 OFFSET_Y = {center_y}
 Z_FACTOR = {z_factor}
+RAMP_STOPS = np.array({ramp_stops.tolist()})
+RAMP_RGB = np.array({(ramp_rgb / 255.0).round(6).tolist()})
 
 data_list = [
 """
@@ -2404,21 +2606,10 @@ def run():
                     z_range = z_max - z_min + 1e-6
                     z_norm = (z_vals - z_min) / z_range
 
-                    # Definiujemy stopy kolorystyczne (R, G, B w skali 0-1)
-                    # Dokładnie takie jak w Twoim auto_style
-                    stops = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
-                    colors_rgb = np.array([
-                        [38/255, 115/255, 0/255],   # Ciemna zieleń
-                        [139/255, 209/255, 0/255],  # Jasna zieleń
-                        [255/255, 255/255, 190/255],# Żółty/Krem
-                        [200/255, 130/255, 0/255],  # Pomarańcz/Brąz
-                        [100/255, 40/255, 0/255]    # Ciemny brąz
-                    ])
-
-                    # Interpolacja liniowa dla każdego kanału
+                    # Rampa hipsometryczna z core.colormap (RGB w skali 0-1), interpolacja na kanał
                     final_colors = np.zeros((len(z_norm), 3))
                     for i in range(3): # Dla R, G, B
-                        final_colors[:, i] = np.interp(z_norm, stops, colors_rgb[:, i])
+                        final_colors[:, i] = np.interp(z_norm, RAMP_STOPS, RAMP_RGB[:, i])
                     
                     pcd.colors = o3d.utility.Vector3dVector(final_colors)
                 
@@ -2692,6 +2883,43 @@ if errorlevel 1 pause
                 f"Obsługuję: Vektor, Raster, LiDAR"
             )
 
+    def batch_import_to_postgis_action(self):
+        if not self.db:
+            QtWidgets.QMessageBox.warning(self, "Info", "Połącz się najpierw z bazą.")
+            return
+
+        folder = QtWidgets.QFileDialog.getExistingDirectory(self, "Folder z danymi (GPKG/SHP/...)", self.data_dir)
+        if not folder: return
+
+        pattern, ok = QtWidgets.QInputDialog.getText(
+            self, "Import wsadowy", "Wzorzec plików (glob, ** = podfoldery):", text="**/*.*"
+        )
+        if not ok: return
+
+        workers, ok = QtWidgets.QInputDialog.getInt(
+            self, "Import wsadowy", "Liczba równoległych importów:", min(4, default_workers()), 1, 32
+        )
+        if not ok: return
+
+        items = ["EPSG:2180 (PUWG 1992)", "EPSG:4326 (WGS 84)", "Bez zmian"]
+        item, ok = QtWidgets.QInputDialog.getItem(self, "Układ", "Reprojekcja przed wysyłką:", items, 0, False)
+        if not ok: return
+        target_srid = 2180 if "2180" in item else 4326 if "4326" in item else None
+
+        def show_report(report):
+            self.display_bench_results(report)
+            failed = report[report["Status"] != "OK"]
+            msg = f"Zaimportowano {len(report) - len(failed)} / {len(report)} warstw.\nRaport w zakładce benchmarku."
+            if not failed.empty:
+                msg += "\n\nBłędy:\n" + "\n".join(f"{r['Plik']}: {r['Status']}" for _, r in failed.head(10).iterrows())
+            QtWidgets.QMessageBox.information(self, "Import wsadowy", msg)
+
+        self.status.showMessage("Import wsadowy do PostGIS...", 0)
+        self.start_worker(
+            self.db.import_batch, os.path.join(folder, pattern),
+            workers=workers, target_srid=target_srid, result_callback=show_report
+        )
+
     def _upload_vector_to_postgis(self, layer_obj):
         from qgis.core import QgsVectorFileWriter, QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsProject
         
@@ -2746,9 +2974,6 @@ if errorlevel 1 pause
 
 
     def _upload_raster_to_postgis(self, layer_name, src_path):
-        from sqlalchemy import text
-        import subprocess
-        
         if not os.path.exists(src_path):
             QtWidgets.QMessageBox.warning(self, "Info", "Plik rastra musi być lokalny.")
             return
@@ -2757,6 +2982,18 @@ if errorlevel 1 pause
         table_name, ok = QtWidgets.QInputDialog.getText(self, "Tabela Raster", "Nazwa tabeli:", text=default_name)
         if not ok: return
 
+        # Kolejne arkusze tej samej mozaiki trafiają do tej samej tabeli (ładowane równolegle)
+        paths = [src_path]
+        reply = QtWidgets.QMessageBox.question(
+            self, "Mozaika", "Dołączyć kolejne arkusze rastra do tej samej tabeli?",
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No
+        )
+        if reply == QtWidgets.QMessageBox.Yes:
+            extra, _ = QtWidgets.QFileDialog.getOpenFileNames(
+                self, "Wybierz arkusze", os.path.dirname(src_path), "Rastry (*.tif *.tiff *.asc *.img *.vrt)"
+            )
+            paths += [f for f in extra if os.path.normcase(f) != os.path.normcase(src_path)]
+
         raster2pgsql = self._find_tool("raster2pgsql")
         if not raster2pgsql:
             QtWidgets.QMessageBox.critical(self, "Błąd", "Nie znaleziono narzędzia raster2pgsql.")
@@ -2765,32 +3002,14 @@ if errorlevel 1 pause
         self.status.showMessage("Importowanie rastra...", 0)
         QtWidgets.QApplication.processEvents()
 
-        def run_import():
-
-            srid = "2180"
-            cmd = [raster2pgsql, "-I", "-C", "-s", srid, "-F", src_path, table_name] 
-            
-            proc = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
-            if proc.returncode != 0: raise RuntimeError(f"raster2pgsql error: {proc.stderr}")
-
-            sql = proc.stdout
-            if not sql: raise RuntimeError("Pusty SQL z raster2pgsql")
-
-
-            with self.db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-                conn.execute(text(sql))
-
-                conn.execute(text(f'ANALYZE "{table_name}";'))
-            return True
-
-        self.start_worker(run_import)
+        self.start_worker(
+            self.db.import_raster, paths, table_name,
+            workers=default_workers(), raster2pgsql=raster2pgsql
+        )
 
 
     def _upload_lidar_to_postgis(self, layer_name, las_path):
 
-        from sqlalchemy import text
-        
-
         default_name = os.path.splitext(os.path.basename(las_path))[0].lower()
         table_name, ok = QtWidgets.QInputDialog.getText(
             self, "Tabela LiDAR", "Nazwa tabeli w PostGIS:", text=default_name
@@ -2802,7 +3021,7 @@ if errorlevel 1 pause
             self,
             "Metoda",
             "Jak importować LiDAR?",
-            ["Punkty (XYZ - szybko)", "Raster DEM (tiff + tiles - wizualizacja)"],
+            ["Punkty (XYZ - pełna gęstość, COPY)", "Łatki pcpatch (pgpointcloud)", "Raster DEM (tiff + tiles - wizualizacja)"],
             0,
             False
         )
@@ -2811,71 +3030,16 @@ if errorlevel 1 pause
         self.status.showMessage("Importowanie LiDAR...", 0)
         QtWidgets.QApplication.processEvents()
 
-        if method.startswith("Punkty"):
-            try:
-                import laspy
-                import pandas as pd
-                import geopandas as gpd
-                import numpy as np
-                
-                las = laspy.read(las_path)
-                
-                x = np.asarray(las.x, dtype='float64').flatten()
-                y = np.asarray(las.y, dtype='float64').flatten()
-                z = np.asarray(las.z, dtype='float64').flatten()
-                
-                data = {
-                    'x': x, 'y': y, 'z': z,
-                    'intensity': np.asarray(las.intensity, dtype='float64').flatten() if hasattr(las, 'intensity') else np.zeros(len(x)),
-                    'classification': np.asarray(las.classification, dtype='int32').flatten() if hasattr(las, 'classification') else np.zeros(len(x), dtype='int32'),
-                }
-                
-                if hasattr(las, 'return_number'):
-                    data['return_num'] = np.asarray(las.return_number, dtype='int32').flatten()
-                
-                df = pd.DataFrame(data)
-                
-                # CRS detection
-                crs_epsg = "EPSG:2180"
-                try:
-                    from pyproj import CRS
-                    if hasattr(las.header, 'parse_crs'):
-                        crs_wkt = las.header.parse_crs()
-                        if crs_wkt:
-                            crs_obj = CRS.from_wkt(crs_wkt)
-                            epsg = crs_obj.to_epsg()
-                            if epsg: crs_epsg = f"EPSG:{epsg}"
-                except:
-                    pass
-                
+        if not method.startswith("Raster"):
+            use_pointcloud = method.startswith("Łatki")
+            if use_pointcloud:
+                caps = self.db.check_advanced_capabilities()
+                if not caps.get("pointcloud"):
+                    QtWidgets.QMessageBox.warning(self, "pgpointcloud", "Baza nie obsługuje pgpointcloud - import jako punkty.")
+                    use_pointcloud = False
 
-                max_points = 1_000_000
-                if len(df) > max_points:
-                    reply = QtWidgets.QMessageBox.question(
-                        self, "Dużo punktów",
-                        f"LiDAR ma {len(df):,} punktów.\n\nZaimportować tylko {max_points:,}?",
-                        QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
-                        QtWidgets.QMessageBox.Yes
-                    )
-                    if reply == QtWidgets.QMessageBox.Yes:
-                        df = df.sample(n=max_points, random_state=42)
-                
-                gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['x'], df['y']), crs=crs_epsg)
-                gdf = gdf.drop(columns=['x', 'y'])
-                
-                gdf.to_postgis(table_name, self.db.engine, if_exists='replace', index=False, chunksize=10000)
-                
-                try:
-                    with self.db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
-                        conn.execute(text(f"CREATE INDEX idx_{table_name}_geom ON {table_name} USING GIST(geometry)"))
-                        conn.execute(text(f"VACUUM ANALYZE {table_name}"))
-                except Exception as e:
-                    print(f"Ostrzeżenie przy tworzeniu indeksu: {e}")
-                
-                QtWidgets.QMessageBox.information(self, "Sukces", f"LiDAR XYZ zaimportowany do {table_name}")
-                
-            except Exception as e:
-                QtWidgets.QMessageBox.critical(self, "Błąd", f"Import LiDAR:\n{e}")
+            # Cały plik, porcjami - bez próbkowania
+            self.start_worker(self.db.import_lidar, las_path, table_name=table_name, use_pointcloud=use_pointcloud)
         
         else:
             try:
@@ -2979,15 +3143,18 @@ if errorlevel 1 pause
             
         try:
 
-            ls = self.db.get_available_layers()
+            catalog = self.db.layer_catalog()
+            ls = [(l["schema"], l["table"], l["column"], l["srid"], l["type"]) for l in catalog]
             if not ls: 
                 QtWidgets.QMessageBox.information(self, "Info", "Brak warstw w DB.")
                 return
 
             display = []
-            for r in ls:
-                icon = "🗺️" if r[4] == 'VEK' else "⬛"
-                display.append(f"{icon} {r[0]}.{r[1]} ({r[4]})")
+            for l in catalog:
+                icon = "🗺️" if l["type"] == 'VEK' else "⬛"
+                rows = f", ~{l['rows']:,} wierszy" if l["rows"] is not None else ""
+                index = "" if l["has_index"] else ", bez indeksu!"
+                display.append(f"{icon} {l['schema']}.{l['table']} ({l['type']}{rows}{index})")
 
             item, ok = QtWidgets.QInputDialog.getItem(self, "Wybierz", "Dostępne warstwy:", display, 0, False)
             
@@ -3074,7 +3241,7 @@ if errorlevel 1 pause
         QtWidgets.QApplication.processEvents()
 
         try:
-            web_gen = WebMapGenerator(self.data_dir)
+            web_gen = WebMapGenerator(self.data_dir, generalize_zoom=self._web_generalize_zoom())
             
             # Import potrzebny do wykrycia stylu "NoBrush"
             from qgis.PyQt.QtCore import Qt
@@ -3125,21 +3292,29 @@ if errorlevel 1 pause
                     src_path = source.split("|")[0]
                     svg_name = None
                     geom_type = QgsWkbTypes.geometryType(layer.wkbType())
+                    # Tabele z podłączonej bazy: kafle MVT na żywo z /tiles/ (bez eksportu do GeoJSON)
+                    live_table = self._postgis_table(layer) if self.tile_provider else None
                     # Logika Cache (dla WFS/DB)
                     is_remote = (provider in ["postgres", "wfs", "memory"]) or (not os.path.exists(src_path))
-                    if is_remote:
+                    if is_remote and not live_table:
                         try:
                             from qgis.core import QgsVectorFileWriter, QgsCoordinateReferenceSystem
                             safe_name = "".join([c for c in name if c.isalnum()])
                             cache_file = os.path.join(cache_dir, f"cache_{safe_name}.geojson")
-                            if os.path.exists(cache_file):
-                                try: os.remove(cache_file)
+                            # Eksport do pliku tymczasowego; cache podmieniany tylko, gdy treść się zmieniła
+                            # (zachowany mtime i skrót = gotowe artefakty warstwy używane ponownie)
+                            tmp_file = os.path.join(cache_dir, f"cache_{safe_name}.tmp.geojson")
+                            if os.path.exists(tmp_file):
+                                try: os.remove(tmp_file)
                                 except: pass
                             err = QgsVectorFileWriter.writeAsVectorFormat(
-                                layer, cache_file, "UTF-8",
+                                layer, tmp_file, "UTF-8",
                                 QgsCoordinateReferenceSystem("EPSG:4326"), "GeoJSON"
                             )
-                            if err[0] == QgsVectorFileWriter.NoError: src_path = cache_file
+                            if err[0] == QgsVectorFileWriter.NoError:
+                                if not web_gen.build_cache.replace_if_changed(tmp_file, cache_file):
+                                    print(f"♻️ {name}: dane bez zmian, używam cache")
+                                src_path = cache_file
                         except: continue
                     label_field = None
                     if layer.labelsEnabled():
@@ -3232,16 +3407,26 @@ if errorlevel 1 pause
                     except Exception as ex:
                         print(f"Błąd stylu: {ex}")
 
-                    if web_gen.add_vector_layer(src_path, name, style_params=style_params):
+                    if live_table:
+                        if web_gen.add_vector_tile_layer(
+                            name, style_params, tile_url=MVTTileProvider.tile_url(live_table, base_url=""),
+                            layer_id=live_table.split(".")[-1]
+                        ):
+                            count += 1
+                    elif web_gen.add_vector_layer(src_path, name, style_params=style_params,
+                                                  mode="auto" if self.chk_vector_tiles.isChecked() else "geojson"):
                         count += 1
 
                 elif isinstance(layer, QgsRasterLayer) and provider == "gdal":
                     if src_path.lower().endswith(('.tif', '.tiff', '.asc')):
-                        if web_gen.add_raster_layer(src_path, name): count += 1
+                        if web_gen.add_raster_layer(src_path, name, mode="tiles", workers=default_workers()): count += 1
 
             if count > 0:
                 web_gen.save_map(out_html)
-                self.status.showMessage("Mapa zaktualizowana.", 5000)
+                stats = web_gen.build_stats
+                self.status.showMessage(
+                    f"Mapa zaktualizowana (przebudowane warstwy: {stats['rebuilt']}, z cache: {stats['reused']})."
+                    + self._generalization_summary(web_gen.generalization_report), 10000)
             else:
                 QtWidgets.QMessageBox.warning(self, "Pusto", "Brak warstw.")
 
@@ -3351,6 +3536,14 @@ if errorlevel 1 pause
         def on_success(res):
             self.status.showMessage("Zadanie zakończone.", 5000)
 
+            if self.db and self.db.engine is not None:
+                pool = self.db.pool_stats()
+                self.lbl_db_status.setToolTip(
+                    f"Pula: {pool['checked_out']}/{pool['size']} zajęte, overflow {pool['overflow']}\n"
+                    f"Checkout: śr. {pool.get('avg_wait_ms', 0)} ms, p95 {pool.get('p95_wait_ms', 0)} ms, "
+                    f"max {pool.get('max_wait_ms', 0)} ms ({pool.get('checkouts', 0)} pobrań)"
+                )
+
             if result_callback:
                 result_callback(res)
 
@@ -8,7 +8,7 @@ CALL "%OSGEO4W_ROOT%\bin\o4w_env.bat"
 echo.
 echo Instalacja wymaganych bibliotek Python dla GISMOOTH...
 echo.
-python -m pip install psycopg2-binary sqlalchemy pandas matplotlib seaborn openpyxl fiona geopandas rasterio pyproj shapely open3d laspy numpy folium mapclassify pydeck urllib3 rtree lazrs 
+python -m pip install psycopg2-binary sqlalchemy pandas matplotlib seaborn openpyxl fiona geopandas rasterio pyproj shapely open3d laspy numpy folium mapclassify pydeck urllib3 rtree lazrs pyogrio pyarrow 
 
 echo.
 echo Instalacja zakonczona.